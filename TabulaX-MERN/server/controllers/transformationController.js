@@ -1,19 +1,68 @@
 const fs = require('fs');
 const path = require('path');
+const zlib = require('zlib');
+const crypto = require('crypto');
+const { promisify } = require('util');
 const axios = require('axios');
 const Transformation = require('../models/Transformation');
 
+// Uploads are kept per user in uploads/<user id>/
+const UPLOADS_DIR = path.join(__dirname, '../uploads');
+const TABLE_FILE_EXTENSIONS = ['.csv', '.json', '.jsonl', '.ndjson', '.parquet'];
+
 // Helper function to save uploaded file
-const saveFile = (file, filename) => {
+const saveFile = (file, filename, userId) => {
   return new Promise((resolve, reject) => {
-    const filePath = path.join(__dirname, '../uploads', filename);
-    fs.writeFile(filePath, file.buffer, (err) => {
-      if (err) return reject(err);
-      resolve(filePath);
+    const userDir = path.join(UPLOADS_DIR, String(userId));
+    fs.mkdir(userDir, { recursive: true }, (mkdirErr) => {
+      if (mkdirErr) return reject(mkdirErr);
+      const filePath = path.join(userDir, filename);
+      fs.writeFile(filePath, file.buffer, (err) => {
+        if (err) return reject(err);
+        resolve(filePath);
+      });
     });
   });
 };
 
+// Resolves a table file reference from the client (an upload id or file name) against the
+// requesting user's uploads. Returns the path relative to uploads/ to forward to Flask, or
+// null when the user has no such upload.
+const resolveUserUpload = (req, reference) => {
+  if (typeof reference !== 'string' || !reference || /[\\/]/.test(reference) || reference.startsWith('.')) {
+    return null;
+  }
+  const userDir = path.join(UPLOADS_DIR, String(req.user.id));
+  const names = path.extname(reference) ? [reference] : TABLE_FILE_EXTENSIONS.map((ext) => reference + ext);
+  if (!names.some((name) => fs.existsSync(path.join(userDir, name)))) {
+    return null;
+  }
+  return `${req.user.id}/${reference}`;
+};
+
+const uploadNotFound = (res, reference) => res.status(404).json({
+  success: false,
+  message: `Upload '${reference}' not found.`
+});
+
+const gzip = promisify(zlib.gzip);
+
+// JSON bodies at least this large are gzipped before being sent to Flask. Flask compresses
+// large responses the same way and axios decompresses them transparently.
+const FLASK_COMPRESSION_MIN_BYTES = parseInt(process.env.FLASK_COMPRESSION_MIN_BYTES || '8192', 10);
+
+// POST a JSON payload to the Flask service
+const postToFlask = async (url, payload) => {
+  const body = JSON.stringify(payload);
+  if (Buffer.byteLength(body) < FLASK_COMPRESSION_MIN_BYTES) {
+    return axios.post(url, body, { headers: { 'Content-Type': 'application/json' } });
+  }
+  return axios.post(url, await gzip(body), {
+    headers: { 'Content-Type': 'application/json', 'Content-Encoding': 'gzip' },
+    maxBodyLength: Infinity
+  });
+};
+
 // @desc    Classify transformation
 // @route   POST /api/transformations/classify
 // @access  Private
@@ -28,7 +77,7 @@ exports.classifyTransformation = async (req, res, next) => {
     }
     // Call Flask API
     try {
-      const flaskRes = await axios.post('http://localhost:5001/classify', {
+      const flaskRes = await postToFlask('http://localhost:5001/classify', {
         source_data: sourceData,
         target_data: targetData
       });
@@ -82,7 +131,7 @@ exports.applyTransformation = async (req, res, next) => {
 
     // Call Flask API
     try {
-      const flaskRes = await axios.post('http://localhost:5001/apply', {
+      const flaskRes = await postToFlask('http://localhost:5001/apply', {
         data: dataToTransform,
         column: columnToTransform,
         transformation_type: transformationType,
@@ -288,28 +337,39 @@ exports.executeTransformation = async (req, res, next) => {
   try {
     const {
       tableData,
+      tableFile, // Optional instead of tableData: the id or name of one of the user's CSV/JSON/Parquet uploads, read by Flask directly
       transformationId,
       transformationType,
       transformationCode, // This might be undefined for 'General' type
       inputColumnName,
-      outputColumnName
+      outputColumnName,
+      incremental, // Optional: only re-transform rows that changed since the last run on datasetId
+      datasetId,
+      rowKeyColumns,
+      storeResult, // Optional: keep the result on the Flask side and return only its first page
+      pageSize
     } = req.body;
 
     // Basic validation for universally required fields
-    if (!tableData || !transformationId || !transformationType || !inputColumnName || !outputColumnName) {
+    if (!(tableData || tableFile) || !transformationId || !transformationType || !inputColumnName || !outputColumnName) {
       return res.status(400).json({
         success: false,
-        message: 'Missing required fields: tableData, transformationId, transformationType, inputColumnName, or outputColumnName'
+        message: 'Missing required fields: tableData (or tableFile), transformationId, transformationType, inputColumnName, or outputColumnName'
       });
     }
 
-    if (!Array.isArray(tableData) || tableData.length === 0) {
+    if (!tableFile && (!Array.isArray(tableData) || tableData.length === 0)) {
       return res.status(400).json({
         success: false,
         message: 'tableData must be a non-empty array.'
       });
     }
 
+    const tableRef = tableFile && resolveUserUpload(req, tableFile);
+    if (tableFile && !tableRef) {
+      return uploadNotFound(res, tableFile);
+    }
+
     let transformationDetailsToExecute = null;
     let codeToExecute = transformationCode; // Default to provided code
 
@@ -356,18 +416,25 @@ exports.executeTransformation = async (req, res, next) => {
     }
 
     const flaskPayload = {
-      table_data: tableData,
+      ...(tableRef ? { table_file: tableRef } : { table_data: tableData }),
       input_column_name: inputColumnName,
       output_column_name: outputColumnName,
       transformation_type: transformationType,
       // Conditionally add execution details
       ...(codeToExecute && { transformation_code: codeToExecute }),
-      ...(transformationDetailsToExecute && { transformation_details: transformationDetailsToExecute })
+      ...(transformationDetailsToExecute && { transformation_details: transformationDetailsToExecute }),
+      ...(incremental && {
+        incremental: true,
+        transformation_id: transformationId,
+        dataset_id: datasetId,
+        row_key_columns: rowKeyColumns
+      }),
+      ...(storeResult && { store_result: true, page_size: pageSize, result_owner: req.user.id })
     };
 
     try {
       const flaskApiUrl = process.env.FLASK_API_URL || 'http://localhost:5001'; // Corrected default port for Flask
-      const response = await axios.post(`${flaskApiUrl}/execute-transformation`, flaskPayload);
+      const response = await postToFlask(`${flaskApiUrl}/execute-transformation`, flaskPayload);
 
       if (response.data.success) {
         return res.status(200).json(response.data);
@@ -392,3 +459,249 @@ exports.executeTransformation = async (req, res, next) => {
     next(error);
   }
 };
+
+// @desc    Execute several saved transformations on one table in a single Flask call
+// @route   POST /api/transformations/execute-batch
+// @access  Private
+exports.executeTransformationsBatch = async (req, res, next) => {
+  try {
+    const { tableData, tableFile, transformations, storeResult, pageSize } = req.body;
+
+    if ((!tableFile && (!Array.isArray(tableData) || tableData.length === 0)) || !Array.isArray(transformations) || transformations.length === 0) {
+      return res.status(400).json({
+        success: false,
+        message: 'tableData (or tableFile) and transformations must be non-empty arrays.'
+      });
+    }
+
+    const tableRef = tableFile && resolveUserUpload(req, tableFile);
+    if (tableFile && !tableRef) {
+      return uploadNotFound(res, tableFile);
+    }
+
+    const specs = [];
+    for (const { transformationId, inputColumnName, outputColumnName } of transformations) {
+      if (!transformationId || !inputColumnName || !outputColumnName) {
+        return res.status(400).json({
+          success: false,
+          message: 'Each transformation needs transformationId, inputColumnName, and outputColumnName.'
+        });
+      }
+      const fetchedTransformation = await Transformation.findById(transformationId);
+      if (!fetchedTransformation) {
+        return res.status(404).json({
+          success: false,
+          message: `Transformation ${transformationId} not found.`
+        });
+      }
+      if (fetchedTransformation.user.toString() !== req.user.id) {
+        return res.status(401).json({
+          success: false,
+          message: 'Not authorized to execute this transformation.'
+        });
+      }
+      const transformationType = fetchedTransformation.transformationType;
+      specs.push({
+        input_column_name: inputColumnName,
+        output_column_name: outputColumnName,
+        transformation_type: transformationType,
+        ...(transformationType === 'General'
+          ? { transformation_details: fetchedTransformation }
+          : { transformation_code: fetchedTransformation.transformationCode })
+      });
+    }
+
+    try {
+      const flaskApiUrl = process.env.FLASK_API_URL || 'http://localhost:5001';
+      const response = await postToFlask(`${flaskApiUrl}/execute-transformations-batch`, {
+        ...(tableRef ? { table_file: tableRef } : { table_data: tableData }),
+        transformations: specs,
+        store_result: storeResult,
+        page_size: pageSize,
+        result_owner: req.user.id
+      });
+      return res.status(200).json(response.data);
+    } catch (error) {
+      console.error('Error calling Flask API for execute-transformations-batch:', error.response ? JSON.stringify(error.response.data) : error.message);
+      const err = new Error(error.response?.data?.message || 'Failed to execute transformations via Flask server');
+      err.statusCode = error.response?.status || 500;
+      err.details = error.response?.data?.details;
+      return next(err);
+    }
+  } catch (error) {
+    if (!error.statusCode) {
+      error.statusCode = 500;
+    }
+    next(error);
+  }
+};
+
+// @desc    Apply a saved transformation and fuzzy join the result in one Flask call
+// @route   POST /api/transformations/transform-and-join
+// @access  Private
+exports.transformAndJoin = async (req, res, next) => {
+  try {
+    const {
+      sourceData,
+      targetData,
+      sourceFile, // Optional ids or names of the user's uploads instead of sourceData/targetData
+      targetFile,
+      transformationId,
+      inputColumnName,
+      outputColumnName,
+      targetColToJoinOn,
+      transformationClass,
+      maxDistanceThreshold,
+      blockingColumns,
+      blockingKeys,
+      page,
+      pageSize,
+      storeResult
+    } = req.body;
+
+    if (!(sourceData || sourceFile) || !(targetData || targetFile) || !transformationId || !inputColumnName || !targetColToJoinOn || maxDistanceThreshold === undefined) {
+      return res.status(400).json({
+        success: false,
+        message: 'Missing required fields: sourceData (or sourceFile), targetData (or targetFile), transformationId, inputColumnName, targetColToJoinOn, or maxDistanceThreshold'
+      });
+    }
+
+    const sourceRef = sourceFile && resolveUserUpload(req, sourceFile);
+    if (sourceFile && !sourceRef) {
+      return uploadNotFound(res, sourceFile);
+    }
+    const targetRef = targetFile && resolveUserUpload(req, targetFile);
+    if (targetFile && !targetRef) {
+      return uploadNotFound(res, targetFile);
+    }
+
+    const fetchedTransformation = await Transformation.findById(transformationId);
+    if (!fetchedTransformation) {
+      return res.status(404).json({
+        success: false,
+        message: 'Transformation not found.'
+      });
+    }
+    if (fetchedTransformation.user.toString() !== req.user.id) {
+      return res.status(401).json({
+        success: false,
+        message: 'Not authorized to execute this transformation.'
+      });
+    }
+
+    const transformationType = fetchedTransformation.transformationType;
+    const flaskPayload = {
+      ...(sourceRef ? { source_file: sourceRef } : { source_data: sourceData }),
+      ...(targetRef ? { target_file: targetRef } : { target_data: targetData }),
+      input_column_name: inputColumnName,
+      output_column_name: outputColumnName,
+      transformation_type: transformationType,
+      target_col_to_join_on: targetColToJoinOn,
+      // General outputs are compared as strings unless the caller picks a distance class
+      transformation_class: transformationClass || (transformationType === 'General' ? 'String-based' : transformationType),
+      max_distance_threshold: maxDistanceThreshold,
+      blocking_columns: blockingColumns,
+      blocking_keys: blockingKeys,
+      page,
+      page_size: pageSize,
+      ...(storeResult && { store_result: true, result_owner: req.user.id }),
+      ...(transformationType === 'General'
+        ? { transformation_details: fetchedTransformation }
+        : { transformation_code: fetchedTransformation.transformationCode })
+    };
+
+    try {
+      const flaskApiUrl = process.env.FLASK_API_URL || 'http://localhost:5001';
+      const response = await postToFlask(`${flaskApiUrl}/transform-and-join`, flaskPayload);
+      return res.status(200).json(response.data);
+    } catch (error) {
+      console.error('Error calling Flask API for transform-and-join:', error.response ? JSON.stringify(error.response.data) : error.message);
+      const err = new Error(error.response?.data?.message || 'Failed to transform and join via Flask server');
+      err.statusCode = error.response?.status || 500;
+      err.details = error.response?.data?.details;
+      return next(err);
+    }
+  } catch (error) {
+    if (!error.statusCode) {
+      error.statusCode = 500;
+    }
+    next(error);
+  }
+};
+
+// @desc    Upload a CSV/JSON/Parquet table for tableFile, sourceFile or targetFile
+// @route   POST /api/transformations/uploads
+// @access  Private
+exports.uploadTableFile = async (req, res, next) => {
+  try {
+    if (!req.file) {
+      return res.status(400).json({
+        success: false,
+        message: "A table file must be sent in the 'file' field."
+      });
+    }
+    const extension = path.extname(req.file.originalname || '').toLowerCase();
+    if (!TABLE_FILE_EXTENSIONS.includes(extension)) {
+      return res.status(400).json({
+        success: false,
+        message: `Unsupported table file. Supported: ${TABLE_FILE_EXTENSIONS.join(', ')}`
+      });
+    }
+
+    const uploadId = crypto.randomBytes(16).toString('hex');
+    await saveFile(req.file, `${uploadId}${extension}`, req.user.id);
+    res.status(201).json({
+      success: true,
+      uploadId, // pass as tableFile, sourceFile or targetFile
+      fileName: req.file.originalname,
+      size: req.file.size
+    });
+  } catch (error) {
+    next(error);
+  }
+};
+
+// @desc    Fetch one page of a result stored on the Flask side (storeResult)
+// @route   GET /api/transformations/results/:resultId
+// @access  Private
+exports.getResultPage = async (req, res, next) => {
+  try {
+    const flaskApiUrl = process.env.FLASK_API_URL || 'http://localhost:5001';
+    const { cursor, limit, columns, filterColumn, filterValue, filterOp } = req.query;
+    const response = await axios.get(`${flaskApiUrl}/results/${encodeURIComponent(req.params.resultId)}`, {
+      params: {
+        cursor,
+        limit,
+        columns,
+        filter_column: filterColumn,
+        filter_value: filterValue,
+        filter_op: filterOp,
+        owner: req.user.id
+      }
+    });
+    return res.status(200).json(response.data);
+  } catch (error) {
+    console.error('Error calling Flask API for results:', error.response ? JSON.stringify(error.response.data) : error.message);
+    const err = new Error(error.response?.data?.message || 'Failed to fetch result page from Flask server');
+    err.statusCode = error.response?.status || 500;
+    return next(err);
+  }
+};
+
+// @desc    Delete a stored result
+// @route   DELETE /api/transformations/results/:resultId
+// @access  Private
+exports.deleteResult = async (req, res, next) => {
+  try {
+    const flaskApiUrl = process.env.FLASK_API_URL || 'http://localhost:5001';
+    const response = await axios.delete(`${flaskApiUrl}/results/${encodeURIComponent(req.params.resultId)}`, {
+      params: { owner: req.user.id }
+    });
+    return res.status(200).json(response.data);
+  } catch (error) {
+    console.error('Error calling Flask API for results:', error.response ? JSON.stringify(error.response.data) : error.message);
+    const err = new Error(error.response?.data?.message || 'Failed to delete result on Flask server');
+    err.statusCode = error.response?.status || 500;
+    return next(err);
+  }
+};
@@ -0,0 +1,270 @@
+import os
+import json
+import math
+import time
+import threading
+from collections import deque
+from functools import wraps
+from flask import request, jsonify
+from table_inputs import estimate_table_file_rows, table_file_bytes
+from compression import request_body_bytes, expected_request_body_bytes
+
+# Per-route budgets; override any field with TABULAX_ADMISSION_BUDGETS, e.g.
+# '{"fuzzy-join": {"max_concurrent": 4, "max_cost": 5e9}}'
+DEFAULT_ROUTE_BUDGETS = {
+    'fuzzy-join': {'max_concurrent': 2, 'max_cost': 2e9, 'max_request_cost': 1e10, 'max_queue': 16, 'queue_timeout_s': 30},
+    'execute-transformation': {'max_concurrent': 4, 'max_cost': 5e6, 'max_request_cost': 5e7, 'max_queue': 32, 'queue_timeout_s': 30},
+    'execute-transformations-batch': {'max_concurrent': 2, 'max_cost': 1e7, 'max_request_cost': 1e8, 'max_queue': 16, 'queue_timeout_s': 30},
+    'transform-and-join': {'max_concurrent': 2, 'max_cost': 2e9, 'max_request_cost': 1e10, 'max_queue': 16, 'queue_timeout_s': 30},
+    'apply': {'max_concurrent': 4, 'max_cost': 5e6, 'max_request_cost': 5e7, 'max_queue': 32, 'queue_timeout_s': 30},
+    'classify': {'max_concurrent': 8, 'max_cost': 8, 'max_request_cost': 1, 'max_queue': 32, 'queue_timeout_s': 30},
+}
+# Estimated memory of everything admitted at once, across routes
+ADMISSION_MEMORY_BUDGET_BYTES = float(os.environ.get("TABULAX_ADMISSION_MEMORY_BYTES", str(4 * 1024 ** 3)))
+# Parsed JSON tables take several times their wire size as Python objects and DataFrames
+MEMORY_PER_BODY_BYTE = 10
+# Referenced table files are parsed into compact DataFrames, a few times their data size
+MEMORY_PER_FILE_BYTE = 4
+TABLE_FILE_KEYS = ('table_file', 'source_file', 'target_file')
+# One General LLM call weighs as much as this many rows of local work
+LLM_CALL_COST = 1000
+
+def _load_budgets():
+    budgets = {route: dict(budget) for route, budget in DEFAULT_ROUTE_BUDGETS.items()}
+    overrides = json.loads(os.environ.get("TABULAX_ADMISSION_BUDGETS", "{}"))
+    for route, budget in overrides.items():
+        budgets.setdefault(route, dict(DEFAULT_ROUTE_BUDGETS['execute-transformation'])).update(budget)
+    return budgets
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, status_code, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Admits requests in two steps. reserve_memory() takes the request's estimated memory from
+    the shared budget before its body is parsed; acquire() then waits for the route's
+    concurrency and cost budgets. Requests that don't fit wait in FIFO queues up to the
+    route's queue_timeout_s; a full queue or a timeout is rejected with a Retry-After estimate.
+    """
+    def __init__(self, budgets, memory_budget_bytes):
+        self.budgets = budgets
+        self.memory_budget_bytes = memory_budget_bytes
+        self.memory_in_flight = 0
+        self._memory_queue = deque()
+        self._condition = threading.Condition()
+        self._routes = {route: {
+            'queue': deque(), 'in_flight': 0, 'cost_in_flight': 0.0,
+            'admitted_total': 0, 'rejected_total': 0, 'avg_service_s': 1.0
+        } for route in budgets}
+
+    def _fits(self, route, cost):
+        budget, state = self.budgets[route], self._routes[route]
+        if state['in_flight'] == 0:
+            return True # A lone request always runs once it is under max_request_cost
+        return (state['in_flight'] < budget['max_concurrent']
+                and state['cost_in_flight'] + cost <= budget['max_cost'])
+
+    def _retry_after(self, route):
+        budget, state = self.budgets[route], self._routes[route]
+        waves = (len(state['queue']) + 1) / max(1, budget['max_concurrent'])
+        return max(1, math.ceil(waves * state['avg_service_s']))
+
+    def reserve_memory(self, route, memory, reserved=0):
+        """
+        Waits until memory more bytes fit in the shared budget and takes them. reserved is
+        what the request already holds; a request that could never fit is rejected with 413.
+        """
+        budget, state = self.budgets[route], self._routes[route]
+        with self._condition:
+            if reserved + memory > self.memory_budget_bytes:
+                state['rejected_total'] += 1
+                raise AdmissionRejected(f"Request too large for /{route}: estimated memory {reserved + memory:.0f} bytes exceeds {self.memory_budget_bytes:.0f}.", 413)
+            if memory <= 0:
+                return
+            ticket = object()
+            self._memory_queue.append(ticket)
+            deadline = time.monotonic() + budget['queue_timeout_s']
+            while not (self._memory_queue[0] is ticket and self.memory_in_flight + memory <= self.memory_budget_bytes):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._memory_queue.remove(ticket)
+                    state['rejected_total'] += 1
+                    self._condition.notify_all()
+                    raise AdmissionRejected(f"Server busy: timed out waiting for memory for /{route}.", 429, self._retry_after(route))
+                self._condition.wait(remaining)
+            self._memory_queue.popleft()
+            self.memory_in_flight += memory
+            self._condition.notify_all()
+
+    def release_memory(self, memory):
+        with self._condition:
+            self.memory_in_flight -= memory
+            self._condition.notify_all()
+
+    def acquire(self, route, cost):
+        budget, state = self.budgets[route], self._routes[route]
+        with self._condition:
+            if cost > budget['max_request_cost']:
+                state['rejected_total'] += 1
+                raise AdmissionRejected(f"Request too large for /{route}: estimated cost {cost:.0f} exceeds {budget['max_request_cost']:.0f}.", 413)
+            if len(state['queue']) >= budget['max_queue']:
+                state['rejected_total'] += 1
+                raise AdmissionRejected(f"Server busy: /{route} queue is full.", 429, self._retry_after(route))
+
+            ticket = object()
+            state['queue'].append(ticket)
+            deadline = time.monotonic() + budget['queue_timeout_s']
+            while not (state['queue'][0] is ticket and self._fits(route, cost)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    state['queue'].remove(ticket)
+                    state['rejected_total'] += 1
+                    self._condition.notify_all()
+                    raise AdmissionRejected(f"Server busy: timed out waiting for /{route} capacity.", 429, self._retry_after(route))
+                self._condition.wait(remaining)
+
+            state['queue'].popleft()
+            state['in_flight'] += 1
+            state['cost_in_flight'] += cost
+            state['admitted_total'] += 1
+            self._condition.notify_all()
+            return time.monotonic()
+
+    def release(self, route, cost, started_at):
+        state = self._routes[route]
+        with self._condition:
+            state['in_flight'] -= 1
+            state['cost_in_flight'] -= cost
+            state['avg_service_s'] = 0.8 * state['avg_service_s'] + 0.2 * (time.monotonic() - started_at)
+            self._condition.notify_all()
+
+    def metrics_text(self):
+        """
+        Current admission state in the Prometheus text exposition format.
+        """
+        metrics = [
+            ('tabulax_admission_queue_depth', 'gauge', 'Requests waiting for admission', lambda s: len(s['queue'])),
+            ('tabulax_admission_in_flight', 'gauge', 'Requests currently admitted', lambda s: s['in_flight']),
+            ('tabulax_admission_cost_in_flight', 'gauge', 'Estimated cost of admitted requests', lambda s: s['cost_in_flight']),
+            ('tabulax_admission_admitted_total', 'counter', 'Requests admitted', lambda s: s['admitted_total']),
+            ('tabulax_admission_rejected_total', 'counter', 'Requests rejected with 413 or 429', lambda s: s['rejected_total']),
+        ]
+        lines = []
+        with self._condition:
+            for name, metric_type, help_text, value_of in metrics:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for route, state in self._routes.items():
+                    lines.append(f'{name}{{route="{route}"}} {value_of(state)}')
+            lines.append("# HELP tabulax_admission_memory_in_flight_bytes Estimated memory of admitted requests")
+            lines.append("# TYPE tabulax_admission_memory_in_flight_bytes gauge")
+            lines.append(f"tabulax_admission_memory_in_flight_bytes {self.memory_in_flight}")
+            lines.append("# HELP tabulax_admission_memory_queue_depth Requests waiting for memory before their body is read")
+            lines.append("# TYPE tabulax_admission_memory_queue_depth gauge")
+            lines.append(f"tabulax_admission_memory_queue_depth {len(self._memory_queue)}")
+        return "\n".join(lines) + "\n"
+
+admission_controller = AdmissionController(_load_budgets(), ADMISSION_MEMORY_BUDGET_BYTES)
+
+def _rows(value):
+    return len(value) if isinstance(value, list) else 0
+
+def _table_rows(data, table_key):
+    # Inline records, or a file reference under the matching '*_file' key
+    file_key = table_key.replace('_data', '_file')
+    if data.get(file_key) is not None:
+        return estimate_table_file_rows(data.get(file_key))
+    return _rows(data.get(table_key))
+
+def estimate_join_cost(data):
+    source_rows = _table_rows(data, 'source_data')
+    if data.get('reference_id') and not data.get('target_data') and not data.get('target_file'):
+        return source_rows # index lookups instead of a scan of the reference table
+    return source_rows * _table_rows(data, 'target_data')
+
+def estimate_transformation_cost(data, table_key='table_data'):
+    table = data.get(table_key)
+    rows = _table_rows(data, table_key)
+    if data.get('transformation_type') != 'General':
+        return rows
+    if data.get(table_key.replace('_data', '_file')) is not None:
+        # The file is not read here: every estimated row may be a distinct unseen input
+        return rows + LLM_CALL_COST * rows
+    # Every distinct input outside the examples may need its own LLM call
+    details = data.get('transformation_details') or {}
+    known = {str(s).strip() for s in details.get('sourceExamples') or []}
+    input_column = data.get('input_column_name')
+    distinct = {str(row.get(input_column)).strip() for row in table or [] if isinstance(row, dict)}
+    return rows + LLM_CALL_COST * len(distinct - known)
+
+def estimate_apply_cost(data):
+    # /apply names its fields differently and defaults to General
+    return estimate_transformation_cost({
+        'table_data': data.get('data'),
+        'input_column_name': data.get('column'),
+        'transformation_type': data.get('transformation_type', 'General'),
+        'transformation_details': data.get('transformation_details')
+    })
+
+def estimate_batch_cost(data):
+    specs = data.get('transformations')
+    if not isinstance(specs, list):
+        return 0
+    return sum(estimate_transformation_cost(dict(spec, table_data=data.get('table_data'), table_file=data.get('table_file')))
+               for spec in specs if isinstance(spec, dict))
+
+def estimate_transform_and_join_cost(data):
+    return estimate_transformation_cost(data, 'source_data') + estimate_join_cost(data)
+
+def _table_file_bytes(data):
+    if not isinstance(data, dict):
+        return 0
+    return sum(table_file_bytes(data[key]) for key in TABLE_FILE_KEYS if data.get(key) is not None)
+
+def _rejected(e):
+    response = jsonify({'success': False, 'message': str(e)})
+    response.status_code = e.status_code
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def admitted(route, estimate_cost=None):
+    """
+    Route decorator: reserves the request's memory from its body size before the body is
+    read, then estimates its cost from the JSON body and waits for admission, answering 429
+    (with Retry-After) or 413 instead of running when over budget.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            reserved = 0
+            try:
+                memory = expected_request_body_bytes() * MEMORY_PER_BODY_BYTE
+                admission_controller.reserve_memory(route, memory)
+                reserved = memory
+
+                data = request.get_json(silent=True)
+                # The body's real size (unknown up front when encoded) and any table files
+                memory = request_body_bytes() * MEMORY_PER_BODY_BYTE + _table_file_bytes(data) * MEMORY_PER_FILE_BYTE
+                if memory > reserved:
+                    admission_controller.reserve_memory(route, memory - reserved, reserved)
+                    reserved = memory
+
+                cost = estimate_cost(data) if estimate_cost and isinstance(data, dict) else 1
+                started_at = admission_controller.acquire(route, cost)
+            except AdmissionRejected as e:
+                admission_controller.release_memory(reserved)
+                return _rejected(e)
+            except BaseException:
+                admission_controller.release_memory(reserved)
+                raise
+            try:
+                return view(*args, **kwargs)
+            finally:
+                admission_controller.release(route, cost, started_at)
+                admission_controller.release_memory(reserved)
+        return wrapper
+    return decorator
@@ -1,19 +1,116 @@
 import os
-import json
+import unicodedata
 import pandas as pd
 import traceback
-from langchain_google_genai import ChatGoogleGenerativeAI
+from rapidfuzz import process as rf_process
+from rapidfuzz.distance import Levenshtein as rf_levenshtein
+from llm_provider import create_llm
 from langchain_core.messages import HumanMessage
+from example_selection import select_examples
+from incremental_apply import transformation_fingerprint, plan_incremental_run, complete_incremental_run
+from vectorize_transform import apply_transform
+
+# Normalization steps available to the approximate example lookup, applied in the order given
+NORMALIZATION_STEPS = {
+    'strip': lambda s: s.strip(),
+    'collapse_whitespace': lambda s: ' '.join(s.split()),
+    'casefold': lambda s: s.casefold(),
+    'strip_accents': lambda s: ''.join(c for c in unicodedata.normalize('NFKD', s) if not unicodedata.combining(c)),
+    'strip_punctuation': lambda s: ''.join(c for c in s if not unicodedata.category(c).startswith('P')),
+    'sort_tokens': lambda s: ' '.join(sorted(s.split())),
+}
+
+DEFAULT_APPROXIMATE_MATCH = {
+    'enabled': True,
+    'normalization_steps': ['strip', 'casefold', 'strip_accents', 'strip_punctuation', 'collapse_whitespace'],
+    'max_edit_distance': 0,     # typos tolerated after normalization; opt-in, as short distinct keys differ by one edit ('Iran'/'Iraq')
+    'max_edit_ratio': 0.25,     # and never more than this fraction of the input length
+    'min_edit_length': 6        # nor for inputs shorter than this after normalization (years, codes)
+}
+
+# Example pairs placed in each General prompt (relationship and per-value calls)
+PROMPT_MAX_EXAMPLES = int(os.environ.get("TABULAX_PROMPT_MAX_EXAMPLES", "20"))
 
 def log_error(message):
     with open("error_log.txt", "a") as f:
         f.write(f"{message}\n")
 
-def generate_general_transformation(transformation_details, new_input_series, llm):
+def normalize_example_value(value, steps):
+    for step in steps:
+        value = NORMALIZATION_STEPS[step](value)
+    return value
+
+def approximate_match_options(approximate_match=None):
+    """
+    DEFAULT_APPROXIMATE_MATCH with the caller's overrides, validated.
+    Raises ValueError for unknown options or normalization steps.
+    """
+    if approximate_match is None:
+        approximate_match = {}
+    if not isinstance(approximate_match, dict):
+        raise ValueError("approximate_match must be an object.")
+    unknown_options = [key for key in approximate_match if key not in DEFAULT_APPROXIMATE_MATCH]
+    if unknown_options:
+        raise ValueError(f"Unknown approximate_match options: {', '.join(unknown_options)}. Supported: {', '.join(DEFAULT_APPROXIMATE_MATCH)}")
+    options = {**DEFAULT_APPROXIMATE_MATCH, **approximate_match}
+    if not isinstance(options['enabled'], bool):
+        raise ValueError("approximate_match.enabled must be true or false.")
+    steps = options['normalization_steps']
+    if not isinstance(steps, list) or not all(isinstance(step, str) for step in steps):
+        raise ValueError("normalization_steps must be a list of step names.")
+    unknown_steps = [step for step in steps if step not in NORMALIZATION_STEPS]
+    if unknown_steps:
+        raise ValueError(f"Unknown normalization steps: {', '.join(unknown_steps)}. Supported: {', '.join(NORMALIZATION_STEPS)}")
+    try:
+        options['max_edit_distance'] = int(options['max_edit_distance'])
+        options['max_edit_ratio'] = float(options['max_edit_ratio'])
+        options['min_edit_length'] = int(options['min_edit_length'])
+    except (ValueError, TypeError):
+        raise ValueError("max_edit_distance, max_edit_ratio and min_edit_length must be numbers.")
+    return options
+
+def build_approximate_lookup(valid_pairs, approximate_match=None):
+    """
+    Builds a lookup over the example sources that tolerates formatting differences and, when
+    max_edit_distance is set, small typos in inputs of at least min_edit_length characters.
+    Returns a function mapping an input string to (target, provenance), or (None, None) when
+    no example is close enough. approximate_match overrides DEFAULT_APPROXIMATE_MATCH.
+    """
+    options = approximate_match_options(approximate_match)
+    steps = options['normalization_steps']
+    if not options['enabled']:
+        return lambda val: (None, None)
+
+    # Normalized keys that map to different targets are ambiguous and left to the LLM
+    normalized_targets = {}
+    for s, t in valid_pairs:
+        normalized_targets.setdefault(normalize_example_value(s, steps), set()).add(t)
+    normalized_index = {key: next(iter(targets)) for key, targets in normalized_targets.items() if len(targets) == 1}
+    normalized_keys = list(normalized_index)
+
+    def lookup(val_str):
+        key = normalize_example_value(val_str, steps)
+        if key in normalized_index:
+            return normalized_index[key], "normalized_match"
+        max_edits = min(int(options['max_edit_distance']), int(len(key) * options['max_edit_ratio']))
+        if max_edits < 1 or len(key) < options['min_edit_length'] or not normalized_keys:
+            return None, None
+        candidates = rf_process.extract(key, normalized_keys, scorer=rf_levenshtein.distance, score_cutoff=max_edits, limit=2)
+        if not candidates:
+            return None, None
+        # A second candidate at the same distance with a different target makes the match ambiguous
+        if len(candidates) > 1 and candidates[1][1] == candidates[0][1] and normalized_index[candidates[1][0]] != normalized_index[candidates[0][0]]:
+            return None, None
+        return normalized_index[candidates[0][0]], "approximate_match"
+
+    return lookup
+
+def generate_general_transformation(transformation_details, new_input_series, llm, approximate_match=None):
     """
     Applies general transformation on new input values using:
     1. A lookup table built from example source-target pairs stored in transformation_details.
-    2. LLM inference for unseen inputs.
+    2. An approximate lookup (normalization, plus a bounded edit distance if requested) over the same examples.
+    3. LLM inference for unseen inputs.
     Returns a dictionary with transformed outputs, provenances, and relationship.
     """
     log_error("Starting generate_general_transformation with transformation_details")
@@ -48,8 +145,15 @@ def generate_general_transformation(transformation_details, new_input_series, ll
     for s, t in valid_pairs:
         examples_dict[s] = t
         normalized_dict[s.lower()] = t
+    approximate_lookup = build_approximate_lookup(valid_pairs, approximate_match)
     
-    pairs_formatted = [f'"{s}" -> "{t}"' for s, t in valid_pairs]
+    # The lookup uses every pair; prompts only carry a representative subset
+    prompt_sources, prompt_targets, prompt_stats = select_examples(
+        [s for s, _ in valid_pairs], [t for _, t in valid_pairs],
+        max_examples=PROMPT_MAX_EXAMPLES, format_pair=lambda s, t: f'"{s}" -> "{t}"\n'
+    )
+    log_error(f"generate_general_transformation prompt examples: {prompt_stats}")
+    pairs_formatted = [f'"{s}" -> "{t}"' for s, t in zip(prompt_sources, prompt_targets)]
     pairs_str = "\n".join(pairs_formatted)
     log_error(f"Created lookup table with {len(examples_dict)} entries from transformation_details")
     
@@ -99,6 +203,12 @@ def generate_general_transformation(transformation_details, new_input_series, ll
                 outputs.append(normalized_dict[val_lower])
                 provenances.append("case_insensitive_match")
                 continue
+
+            approximate_output, approximate_provenance = approximate_lookup(val_str)
+            if approximate_output is not None:
+                outputs.append(approximate_output)
+                provenances.append(approximate_provenance)
+                continue
             
             llm_prompt = f"""
             Examples of transformation ({relationship_line}):
@@ -168,7 +278,7 @@ def apply_transformation_main(data_info):
         # Initialize Gemini model for General transformations
         llm = None
         if transformation_type == "General":
-            llm = ChatGoogleGenerativeAI(
+            llm = create_llm(
                 model="gemini-1.5-flash",
                 temperature=0.7,
                 google_api_key=api_key
@@ -207,52 +317,57 @@ def apply_transformation_main(data_info):
                 target_series = df[column_to_transform]  # Same as source for placeholder
                 new_input_series = df[column_to_transform]  # Transform the same data
             
-            # Generate the transformation
-            output_path = "transformed_output.csv"
-            generate_general_transformation(source_series, target_series, new_input_series, llm, output_path=output_path)
-            
-            try:
-                # Read the output CSV
-                df_output = pd.read_csv(output_path)
-                log_error(f"Successfully generated output with {len(df_output)} rows")
-                
-                # Create result DataFrame
-                if possible_targets:
-                    # We had separate target column - merge results
-                    df_result = pd.concat([
-                        df.iloc[:example_size].assign(Output=target_series.values, Provenance="example"),
-                        df.iloc[example_size:].assign(Output=df_output["Output"].values, Provenance=df_output["Provenance"].values)
-                    ], ignore_index=True)
-                else:
-                    # No separate target - just use the transformation results
-                    df_result = df.copy()
-                    df_result['Output'] = df_output["Output"].values
-                    df_result['Provenance'] = df_output["Provenance"].values
-                    
-                # Add relationship information if available
-                if 'Relationship' in df_output.columns:
-                    relationship = df_output['Relationship'].iloc[0] if len(df_output) > 0 else "Unknown"
-                    df_result['Relationship'] = relationship
-                    log_error(f"Detected relationship: {relationship}")
-                
-                result = {
-                    "transformed_data": df_result.to_dict(orient='records')
-                }
-                return result
-                
-            except Exception as e:
-                log_error(f"Error processing transformation output: {str(e)}")
-                raise ValueError(f"Error processing transformation output: {str(e)}")
+            # Generate the transformation in memory; nothing is written to disk, so
+            # concurrent requests cannot clobber each other's output
+            transformation_details = {
+                'sourceExamples': source_series.tolist(),
+                'targetExamples': target_series.tolist()
+            }
+            gen_result = generate_general_transformation(transformation_details, new_input_series, llm)
+            if not gen_result.get('success'):
+                raise ValueError(gen_result.get('message', 'General transformation failed'))
+            log_error(f"Successfully generated output with {len(gen_result['outputs'])} rows")
+
+            # Create result DataFrame
+            if possible_targets:
+                # We had separate target column - merge results
+                df_result = pd.concat([
+                    df.iloc[:example_size].assign(Output=target_series.values, Provenance="example"),
+                    df.iloc[example_size:].assign(Output=gen_result['outputs'], Provenance=gen_result['provenances'])
+                ], ignore_index=True)
+            else:
+                # No separate target - just use the transformation results
+                df_result = df.assign(Output=gen_result['outputs'], Provenance=gen_result['provenances'])
+
+            df_result['Relationship'] = gen_result['relationship']
+            log_error(f"Detected relationship: {gen_result['relationship']}")
+
+            result = {
+                "transformed_data": df_result.to_dict(orient='records')
+            }
+            return result
 
         else:
             # For other transformations, load and execute the transformation code
+            incremental_stats = None
             if code_file_content:
                 exec_globals = {}
                 exec(code_file_content, exec_globals)
                 transform_func = exec_globals.get('transform')
                 if not transform_func:
                     raise ValueError("Transformation code must define a 'transform' function")
-                df[f'transformed_{column_to_transform}'] = df[column_to_transform].apply(transform_func)
+                if data_info.get('incremental'):
+                    # Only rows inserted or modified since the previous run go through transform
+                    if not data_info.get('dataset_id'):
+                        raise ValueError("Incremental application requires a 'dataset_id'")
+                    fingerprint = transformation_fingerprint(transformation_type, code_file_content)
+                    plan = plan_incremental_run(df, column_to_transform, data_info.get('transformation_id') or fingerprint, data_info['dataset_id'], fingerprint, data_info.get('row_key_columns'))
+                    log_error(f"Incremental application: {plan['stats']}")
+                    changed_outputs = apply_transform(df[column_to_transform].iloc[plan['changed_positions']], transform_func, code_file_content)
+                    df[f'transformed_{column_to_transform}'] = complete_incremental_run(plan, list(changed_outputs))
+                    incremental_stats = plan['stats']
+                else:
+                    df[f'transformed_{column_to_transform}'] = apply_transform(df[column_to_transform], transform_func, code_file_content)
             else:
                 # No transformation code provided
                 df[f'transformed_{column_to_transform}'] = df[column_to_transform]
@@ -261,6 +376,8 @@ def apply_transformation_main(data_info):
             result = {
                 "transformed_data": df.to_dict(orient='records')
             }
+            if incremental_stats is not None:
+                result["incremental"] = incremental_stats
             return result
     except Exception as e:
         error_details = traceback.format_exc()
@@ -5,10 +5,13 @@ import numpy as np
 import re
 import os
 import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm_provider import create_llm
 from langchain.schema import HumanMessage
 from apply_transformation import generate_general_transformation
+from example_selection import select_examples
 
 
 # Set your Gemini API key here or ensure it's in the environment variable GOOGLE_API_KEY
@@ -16,11 +19,33 @@ api_key = os.environ.get("GOOGLE_API_KEY", "")
 genai.configure(api_key=api_key)
 llm = genai.GenerativeModel('gemini-pro')
 
+TRANSFORMATION_TYPES = ["String-based", "Numerical", "Algorithmic", "General"]
+
+# Speculative /classify: generate code for these types while classification is still running
+SPECULATIVE_CLASSIFY = os.environ.get("TABULAX_SPECULATIVE_CLASSIFY", "false").lower() == "true"
+SPECULATIVE_TYPES = [t.strip() for t in os.environ.get("TABULAX_SPECULATIVE_TYPES", "String-based,Algorithmic").split(",") if t.strip()]
+
+class SpeculationCancelled(Exception):
+    pass
+
 # Set up error logging
 def log_error(message):
     with open("error_log.txt", "a") as f:
         f.write(f"{message}\n")
 
+def _parse_bool(value, default):
+    # JSON booleans, or strings such as "true"/"false" from form-encoded clients
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes", "on")
+    return bool(value)
+
+def _check_cancelled(cancelled):
+    # Speculative generators stop before each LLM call once their type has lost
+    if cancelled is not None and cancelled.is_set():
+        raise SpeculationCancelled()
+
 def classify_transformation_main(data_info):
     try:
         # Expecting data_info = {'source_data': [...], 'target_data': [...]}
@@ -45,52 +70,22 @@ def classify_transformation_main(data_info):
             except Exception as e:
                 log_error(f"Error reading API key from .env file: {str(e)}")
 
-        llm = ChatGoogleGenerativeAI(
+        llm = create_llm(
             model="gemini-1.5-flash",  # or "gemini-1.5-flash" for faster responses
             temperature=0.7,
             google_api_key=api_key
         )
 
-        # Perform classification
-        transformation_type = classify_transformation(source_series, target_series, llm)
-        transformation_code = None
-        transformation_details_for_response = None
-        description = None
-
-        if transformation_type == "General":
-            # For General type, get description from apply_transformation.generate_general_transformation
-            source_examples = source_data[:10] # Use first 10 examples, or adjust as needed
-            target_examples = target_data[:10]
-            
-            # Construct details needed by generate_general_transformation
-            # Ensure this matches the structure expected by generate_general_transformation
-            current_transformation_details_for_general = {
-                "sourceExamples": source_examples,
-                "targetExamples": target_examples,
-                # Add any other fields generate_general_transformation might expect from transformation_details
-            }
-            
-            # We pass an empty Series for new_input_series as we only want the relationship description here.
-            # The llm instance is already initialized in classify_transformation_main.
-            general_result = generate_general_transformation(current_transformation_details_for_general, pd.Series([], dtype='object'), llm)
-            
-            if general_result and general_result.get('success'):
-                description = general_result.get('relationship', "General transformation identified. Specifics to be determined during application.")
-            else:
-                description = "Failed to determine relationship for General transformation."
-                log_error(f"generate_general_transformation failed or returned no description. Result: {general_result}")
-            
-            transformation_details_for_response = {"description": description}
-            # For 'General' type, the transformation_code is essentially a comment pointing to the description
-            # as the actual transformation is handled by the LLM in apply_transformation.
-            transformation_code = f"## General Transformation - Logic applied via LLM ##\n# Description: {description}\n# This transformation is handled by a generative model based on the provided examples."
-
-        elif transformation_type == "Numerical":
-            transformation_code = generate_numerical_transformation(source_series, target_series)
-        elif transformation_type == "String-based":
-            transformation_code = generate_string_transformation(source_series, target_series, llm)
-        elif transformation_type == "Algorithmic":
-            transformation_code = generate_algorithmic_transformation(source_series, target_series, llm)
+        # Perform classification, optionally racing the code generators against it
+        if _parse_bool(data_info.get('speculative'), SPECULATIVE_CLASSIFY):
+            transformation_type, transformation_code, transformation_details_for_response = classify_and_generate_speculatively(
+                source_series, target_series, llm, source_data, target_data, data_info.get('speculative_types')
+            )
+        else:
+            transformation_type = classify_transformation(source_series, target_series, llm)
+            transformation_code, transformation_details_for_response = generate_transformation_code(
+                transformation_type, source_series, target_series, llm, source_data, target_data
+            )
 
         result = {
             "success": True,
@@ -107,12 +102,99 @@ def classify_transformation_main(data_info):
             "message": str(e)
         }
 
+def generate_general_description(source_data, target_data, llm, cancelled=None):
+    """
+    Describes a General transformation via the relationship detected by
+    generate_general_transformation. Returns (transformation_code, transformation_details).
+    """
+    _check_cancelled(cancelled)
+    # For General type, get description from apply_transformation.generate_general_transformation
+    source_examples = source_data[:10] # Use first 10 examples, or adjust as needed
+    target_examples = target_data[:10]
+    
+    # Construct details needed by generate_general_transformation
+    # Ensure this matches the structure expected by generate_general_transformation
+    current_transformation_details_for_general = {
+        "sourceExamples": source_examples,
+        "targetExamples": target_examples,
+        # Add any other fields generate_general_transformation might expect from transformation_details
+    }
+    
+    # We pass an empty Series for new_input_series as we only want the relationship description here.
+    general_result = generate_general_transformation(current_transformation_details_for_general, pd.Series([], dtype='object'), llm)
+    
+    if general_result and general_result.get('success'):
+        description = general_result.get('relationship', "General transformation identified. Specifics to be determined during application.")
+    else:
+        description = "Failed to determine relationship for General transformation."
+        log_error(f"generate_general_transformation failed or returned no description. Result: {general_result}")
+    
+    # For 'General' type, the transformation_code is essentially a comment pointing to the description
+    # as the actual transformation is handled by the LLM in apply_transformation.
+    transformation_code = f"## General Transformation - Logic applied via LLM ##\n# Description: {description}\n# This transformation is handled by a generative model based on the provided examples."
+    return transformation_code, {"description": description}
+
+def generate_transformation_code(transformation_type, source_series, target_series, llm, source_data, target_data, cancelled=None):
+    """
+    Generates the code for a classified transformation.
+    Returns (transformation_code, transformation_details); details are only set for General.
+    Raises SpeculationCancelled before the next LLM call once cancelled (a threading.Event) is set.
+    """
+    if transformation_type == "General":
+        return generate_general_description(source_data, target_data, llm, cancelled)
+    elif transformation_type == "Numerical":
+        return generate_numerical_transformation(source_series, target_series), None
+    elif transformation_type == "String-based":
+        return generate_string_transformation(source_series, target_series, llm, cancelled), None
+    elif transformation_type == "Algorithmic":
+        return generate_algorithmic_transformation(source_series, target_series, llm, cancelled), None
+    return None, None
+
+def classify_and_generate_speculatively(source_series, target_series, llm, source_data, target_data, speculative_types=None):
+    """
+    Starts classification and the code generators of the likely types at the same time, keeps
+    the generator matching the classification and cancels the rest, so the result takes about
+    one LLM round trip instead of two or three. A losing generator stops before its next LLM
+    call; only a call already in flight runs to completion and is discarded.
+    Returns (transformation_type, transformation_code, transformation_details).
+    """
+    speculative_types = [t for t in (speculative_types or SPECULATIVE_TYPES) if t in TRANSFORMATION_TYPES]
+    cancel_events = {t: threading.Event() for t in speculative_types}
+    executor = ThreadPoolExecutor(max_workers=len(speculative_types) + 1)
+    try:
+        classification = executor.submit(classify_transformation, source_series, target_series, llm)
+        speculations = {
+            t: executor.submit(generate_transformation_code, t, source_series, target_series, llm, source_data, target_data, cancel_events[t])
+            for t in speculative_types
+        }
+        transformation_type = classification.result()
+
+        for t, future in speculations.items():
+            if t != transformation_type:
+                cancel_events[t].set()
+                future.cancel()
+        if transformation_type in speculations:
+            log_error(f"Speculative generation hit: {transformation_type}")
+            transformation_code, transformation_details = speculations[transformation_type].result()
+        else:
+            log_error(f"Speculative generation miss: {transformation_type} not in {speculative_types}")
+            transformation_code, transformation_details = generate_transformation_code(
+                transformation_type, source_series, target_series, llm, source_data, target_data
+            )
+        return transformation_type, transformation_code, transformation_details
+    finally:
+        for event in cancel_events.values():
+            event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def classify_transformation(source_series, target_series, llm):
     """
     Classify transformation type between source and target columns using an LLM.
     Returns only the transformation type string.
     """
-    source_target_pairs = list(zip(source_series.head(5), target_series.head(5)))
+    selected_sources, selected_targets, prompt_stats = select_examples(source_series, target_series, max_examples=5, baseline_count=5)
+    log_error(f"classify_transformation prompt examples: {prompt_stats}")
+    source_target_pairs = list(zip(selected_sources, selected_targets))
     examples = [f'("{s}" -> "{t}")' for s, t in source_target_pairs]
     serialized_examples = ', '.join(examples)
 
@@ -237,8 +319,15 @@ def generate_numerical_transformation(source_series, target_series):
     else:
         return "def transform(value): return value"
 
-def generate_string_transformation(source_series, target_series, llm):
-    examples = [f"Input: {s}\nExpected output: {t}" for s, t in zip(source_series.head(10), target_series.head(10))]
+def generate_string_transformation(source_series, target_series, llm, cancelled=None):
+    selected_sources, selected_targets, prompt_stats = select_examples(
+        source_series, target_series, max_examples=10, baseline_count=10,
+        format_pair=lambda s, t: f"Input: {s}\nExpected output: {t}\n\n"
+    )
+    log_error(f"generate_string_transformation prompt examples: {prompt_stats}")
+    source_series = pd.Series(selected_sources, dtype=object)
+    target_series = pd.Series(selected_targets, dtype=object)
+    examples = [f"Input: {s}\nExpected output: {t}" for s, t in zip(source_series, target_series)]
     example_text = "\n\n".join(examples)
 
     prompt = f"""
@@ -266,6 +355,7 @@ def generate_string_transformation(source_series, target_series, llm):
                 Only return the Python function code below:
                 """
 
+    _check_cancelled(cancelled)
     # Use the appropriate method based on the LLM type
     if hasattr(llm, 'invoke'):
         # LangChain interface
@@ -283,8 +373,12 @@ def generate_string_transformation(source_series, target_series, llm):
     match = re.search(r"(def transform\(value\):[\s\S]+?)(?=\n{2,}|\Z)", result)
     return match.group(1).strip() if match else result
 
-def generate_algorithmic_transformation(source_series, target_series, llm):
-    examples = [f'("{s}" -> "{t}")' for s, t in zip(source_series.head(10), target_series.head(10))]
+def generate_algorithmic_transformation(source_series, target_series, llm, cancelled=None):
+    selected_sources, selected_targets, prompt_stats = select_examples(source_series, target_series, max_examples=10, baseline_count=10)
+    log_error(f"generate_algorithmic_transformation prompt examples: {prompt_stats}")
+    source_series = pd.Series(selected_sources, dtype=object)
+    target_series = pd.Series(selected_targets, dtype=object)
+    examples = [f'("{s}" -> "{t}")' for s, t in zip(source_series, target_series)]
     serialized_examples = ", ".join(examples)
 
     relationship_prompt = f"""
@@ -306,6 +400,7 @@ def generate_algorithmic_transformation(source_series, target_series, llm):
                         Relationship:
                         """.strip()
 
+    _check_cancelled(cancelled)
     # Use the appropriate method based on the LLM type
     if hasattr(llm, 'invoke'):
         # LangChain interface
@@ -317,7 +412,7 @@ def generate_algorithmic_transformation(source_series, target_series, llm):
         relationship_result = relationship_response.text if hasattr(relationship_response, 'text') else str(relationship_response)
     relationship_line = next((line.strip() for line in reversed(relationship_result.split('\n')) if 'to' in line), relationship_result)
 
-    test_cases = "\n".join([f"Input: {s}\nExpected output: {t}" for s, t in zip(source_series.head(10), target_series.head(10))])
+    test_cases = "\n".join([f"Input: {s}\nExpected output: {t}" for s, t in zip(source_series, target_series)])
 
     function_prompt = f"""
                         Write a Python function called `transform` to perform this transformation: {relationship_line}.
@@ -338,6 +433,7 @@ def generate_algorithmic_transformation(source_series, target_series, llm):
                         Only output the function code:
                         """.strip()
 
+    _check_cancelled(cancelled)
     # Use the appropriate method based on the LLM type
     if hasattr(llm, 'invoke'):
         # LangChain interface
@@ -0,0 +1,169 @@
+import os
+import gzip
+import json
+import zlib
+from flask import request, jsonify
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.wsgi import LimitedStream
+
+try:
+    import zstandard
+except ImportError: # zstd bodies are rejected with 415 without it
+    zstandard = None
+
+# Request bodies may be sent gzip/zstd-encoded (Content-Encoding) and are decompressed while
+# being read. Responses are compressed by Accept-Encoding once they reach the size threshold.
+COMPRESSION_MIN_BYTES = int(os.environ.get("TABULAX_COMPRESSION_MIN_BYTES", "8192"))
+GZIP_LEVEL = int(os.environ.get("TABULAX_GZIP_LEVEL", "5"))
+ZSTD_LEVEL = int(os.environ.get("TABULAX_ZSTD_LEVEL", "3"))
+MAX_DECOMPRESSED_BYTES = int(os.environ.get("TABULAX_MAX_DECOMPRESSED_BYTES", str(512 * 1024 ** 2)))
+# Typical inflation of compressed JSON tables, for sizing a body before it is read
+EXPECTED_COMPRESSION_RATIO = 10
+READ_CHUNK_BYTES = 64 * 1024
+
+def supported_encodings():
+    return ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+
+class UndecodableBody(BadRequest):
+    pass
+
+class DecompressedBodyTooLarge(RequestEntityTooLarge):
+    pass
+
+class _DecompressingStream:
+    """
+    File-like view of a compressed request body; decompression errors become 400s and
+    bodies decompressing to more than limit bytes 413s.
+    """
+    def __init__(self, reader, limit=MAX_DECOMPRESSED_BYTES):
+        self._reader = reader
+        self._limit = limit
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            # Chunk by chunk, so the limit applies before the whole body is inflated
+            chunks = []
+            while True:
+                chunk = self.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+        data = self._read(min(size, self._limit - self.bytes_read + 1))
+        self.bytes_read += len(data)
+        if self.bytes_read > self._limit:
+            raise DecompressedBodyTooLarge(f"Request body decompresses to more than {self._limit} bytes.")
+        return data
+
+    def _read(self, size):
+        try:
+            return self._reader.read(size)
+        except (OSError, EOFError, zlib.error) as e:
+            raise UndecodableBody(f"Could not decompress request body: {e}")
+        except Exception as e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                raise UndecodableBody(f"Could not decompress request body: {e}")
+            raise
+
+    def close(self):
+        self._reader.close()
+
+def _error_response(environ, start_response, status, message):
+    body = json.dumps({'success': False, 'message': message}).encode('utf-8')
+    start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+    return [body]
+
+class DecompressRequestMiddleware:
+    """
+    WSGI middleware replacing wsgi.input of gzip/zstd-encoded requests with a streaming
+    decompressor, so the decompressed body is never buffered next to the compressed one.
+    """
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding in ('', 'identity'):
+            return self.wsgi_app(environ, start_response)
+        if encoding not in ('gzip', 'x-gzip', 'zstd') or (encoding == 'zstd' and zstandard is None):
+            return _error_response(environ, start_response, '415 Unsupported Media Type',
+                                   f"Unsupported Content-Encoding '{encoding}'. Supported: {', '.join(supported_encodings())}")
+
+        body = environ['wsgi.input']
+        content_length = environ.get('CONTENT_LENGTH')
+        if content_length:
+            body = LimitedStream(body, int(content_length))
+        if encoding == 'zstd':
+            reader = zstandard.ZstdDecompressor().stream_reader(body, read_across_frames=True)
+        else:
+            reader = gzip.GzipFile(fileobj=body, mode='rb')
+
+        # The decompressed length is unknown: the body now ends where the stream ends
+        environ['wsgi.input'] = _DecompressingStream(reader)
+        environ['wsgi.input_terminated'] = True
+        environ['tabulax.compressed_length'] = int(content_length) if content_length else 0
+        environ.pop('CONTENT_LENGTH', None)
+        environ.pop('HTTP_CONTENT_ENCODING', None)
+        return self.wsgi_app(environ, start_response)
+
+def request_body_bytes():
+    """
+    Size of the current request's body: the decompressed bytes read so far (at least the
+    compressed length) for an encoded body, Content-Length otherwise.
+    """
+    body = request.environ.get('wsgi.input')
+    if isinstance(body, _DecompressingStream):
+        return max(body.bytes_read, request.environ.get('tabulax.compressed_length', 0))
+    return request.content_length or 0
+
+def expected_request_body_bytes():
+    """
+    Expected size of the current request's body before any of it is read: Content-Length,
+    or for an encoded body its compressed length times EXPECTED_COMPRESSION_RATIO (at most
+    MAX_DECOMPRESSED_BYTES).
+    """
+    if isinstance(request.environ.get('wsgi.input'), _DecompressingStream):
+        return min(request.environ.get('tabulax.compressed_length', 0) * EXPECTED_COMPRESSION_RATIO, MAX_DECOMPRESSED_BYTES)
+    return request.content_length or 0
+
+def compress_response(response, accept_encodings):
+    """
+    Compresses a buffered response with the best encoding the client accepts, unless it is
+    below COMPRESSION_MIN_BYTES, streamed, or already encoded.
+    """
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accept_encodings.best_match(supported_encodings())
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_BYTES:
+        return response
+
+    if encoding == 'zstd':
+        response.set_data(zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def init_compression(app):
+    """
+    Enables compressed request bodies and response negotiation for app.
+    """
+    app.wsgi_app = DecompressRequestMiddleware(app.wsgi_app)
+
+    @app.errorhandler(UndecodableBody)
+    def _undecodable_body(e):
+        return jsonify({'success': False, 'message': e.description}), 400
+
+    @app.errorhandler(DecompressedBodyTooLarge)
+    def _decompressed_body_too_large(e):
+        return jsonify({'success': False, 'message': e.description}), 413
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, request.accept_encodings)
+
+    return app
@@ -0,0 +1,94 @@
+import os
+import math
+import pandas as pd
+
+# Rough prompt budget for the example block of one LLM call (tokens ~ characters / 4)
+DEFAULT_PROMPT_TOKEN_BUDGET = int(os.environ.get("TABULAX_PROMPT_TOKEN_BUDGET", "600"))
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def pattern_shape(value):
+    """
+    Coarse shape of a value: letters, digits and spaces become classes and runs collapse,
+    so "AB-1234" and "XY-9876" share the shape "A-9" while "ab 12" is "a 9".
+    """
+    shape = []
+    for c in value:
+        if c.isdigit():
+            cls = '9'
+        elif c.isalpha():
+            cls = 'A' if c.isupper() else 'a'
+        elif c.isspace():
+            cls = ' '
+        else:
+            cls = c
+        if not shape or shape[-1] != cls:
+            shape.append(cls)
+    return ''.join(shape)
+
+def _length_bucket(value):
+    # 0, 1, 2-3, 4-7, 8-15, ... characters
+    return len(value).bit_length()
+
+def _example_cluster(source, target):
+    return (pattern_shape(source), pattern_shape(target), _length_bucket(source), _length_bucket(target))
+
+def select_examples(source_values, target_values, max_examples=10, token_budget=None, format_pair=None, baseline_count=None):
+    """
+    Picks a small, diverse subset of example pairs for a prompt. Pairs are clustered by the
+    pattern shape and length of source and target; clusters are visited largest first and
+    round-robin, taking the member closest to the cluster's median length each time, until
+    max_examples pairs are chosen or the token budget is spent (at least one pair is kept).
+    format_pair(source, target) renders a pair as it appears in the prompt, for the estimate.
+    Returns (sources, targets, stats); stats compares against the first baseline_count pairs
+    (all pairs when None), i.e. what the prompt would have contained without selection.
+    """
+    token_budget = DEFAULT_PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    format_pair = format_pair or (lambda s, t: f'("{s}" -> "{t}")')
+
+    pairs = []
+    seen = set()
+    for s, t in zip(source_values, target_values):
+        if pd.isna(s) or pd.isna(t):
+            continue
+        pair = (str(s), str(t))
+        if pair not in seen:
+            seen.add(pair)
+            pairs.append(pair)
+
+    clusters = {}
+    for pair in pairs:
+        clusters.setdefault(_example_cluster(*pair), []).append(pair)
+    ordered_clusters = []
+    for members in sorted(clusters.values(), key=len, reverse=True):
+        median_length = sorted(len(s) + len(t) for s, t in members)[len(members) // 2]
+        ordered_clusters.append(sorted(members, key=lambda p: abs(len(p[0]) + len(p[1]) - median_length)))
+
+    selected = []
+    used_tokens = 0
+    round_index = 0
+    while len(selected) < max_examples and any(round_index < len(members) for members in ordered_clusters):
+        for members in ordered_clusters:
+            if round_index >= len(members) or len(selected) >= max_examples:
+                continue
+            pair_tokens = estimate_tokens(format_pair(*members[round_index]))
+            if selected and used_tokens + pair_tokens > token_budget:
+                continue
+            selected.append(members[round_index])
+            used_tokens += pair_tokens
+        round_index += 1
+
+    baseline = [(str(s), str(t)) for s, t in zip(source_values, target_values)]
+    if baseline_count is not None:
+        baseline = baseline[:baseline_count]
+    baseline_tokens = sum(estimate_tokens(format_pair(s, t)) for s, t in baseline)
+    stats = {
+        'examples_available': len(pairs),
+        'examples_selected': len(selected),
+        'estimated_tokens_baseline': baseline_tokens,
+        'estimated_tokens_selected': used_tokens,
+        'estimated_tokens_saved': baseline_tokens - used_tokens
+    }
+    return [s for s, _ in selected], [t for _, t in selected], stats
@@ -1,15 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, copy_current_request_context
 from flask_cors import CORS
 from dotenv import load_dotenv # Added to load .env file
 import requests 
-from apply_transformation import apply_transformation_main, generate_general_transformation, log_error # Added generate_general_transformation, log_error
+from apply_transformation import apply_transformation_main, generate_general_transformation, approximate_match_options, log_error # Added generate_general_transformation, log_error
 from classify_transformation import classify_transformation_main
-from fuzzy_join import perform_fuzzy_join
-from langchain_google_genai import ChatGoogleGenerativeAI # Added for LLM
+from fuzzy_join import match_fuzzy_join, assemble_joined_frame, normalize_blocking_columns, normalize_blocking_keys
+from join_shards import join_shard_workers, sharded_match, match_indices_payload, ShardJoinError
+from frame_utils import records_to_frame, compact_series, frame_to_json_records
+from incremental_apply import transformation_fingerprint, plan_incremental_run, complete_incremental_run
+from vectorize_transform import apply_transform
+from table_inputs import read_table_file, TableInputError
+from reference_index import register_reference_table, get_reference_meta, delete_reference_table, open_reference_index, join_reference, index_family, ReferenceNotFound
+from llm_provider import create_llm, STUB_LLM
+from request_profiling import profiled
+from result_store import save_result, read_result_page, get_result_meta, delete_result, ResultNotFound, DEFAULT_PAGE_SIZE
+from compression import init_compression
+from admission_control import admitted, admission_controller, estimate_join_cost, estimate_transformation_cost, estimate_transform_and_join_cost, estimate_batch_cost, estimate_apply_cost
+from concurrent.futures import ThreadPoolExecutor
 import os # Added for environment variables
 import traceback
 import json
 import pandas as pd
+import numpy as np
 import logging
 import sys
 
@@ -17,12 +29,19 @@ load_dotenv() # Load environment variables from .env file
 
 app = Flask(__name__)
 # Enable CORS with explicit configuration
-CORS(app, resources={r"/*": {"origins": "*", "allow_headers": "*", "methods": ["GET", "POST", "OPTIONS"]}})
+CORS(app, resources={r"/*": {"origins": "*", "allow_headers": "*", "methods": ["GET", "POST", "DELETE", "OPTIONS"]}})
+# gzip/zstd request bodies and Accept-Encoding negotiated responses
+init_compression(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Transformations of one /execute-transformations-batch stage that run at the same time
+BATCH_MAX_WORKERS = int(os.environ.get("TABULAX_BATCH_WORKERS", "4"))
+# Inferred dtypes whose equal values always transform equally (1 == 1.0 == True would not)
+DEDUPLICATED_DTYPES = {'string', 'integer', 'floating', 'boolean', 'empty'}
+
 
 
 # NGROK_BASE_URL = "https://743e-34-143-229-65.ngrok-free.app/" 
@@ -49,6 +68,7 @@ logger = logging.getLogger(__name__)
 
 
 @app.route('/apply', methods=['POST'])
+@admitted('apply', estimate_apply_cost)
 def apply():
     try:
         data = request.json
@@ -58,6 +78,7 @@ def apply():
         return jsonify({'error': True, 'message': str(e), 'traceback': traceback.format_exc()}), 500
 
 @app.route('/classify', methods=['POST'])
+@admitted('classify')
 def classify():
     try:
         data = request.json
@@ -68,7 +89,277 @@ def classify():
 
 
 
+def _create_general_llm():
+    """
+    Builds the LLM used by General transformations.
+    Returns (llm, None) or (None, error_response).
+    """
+    google_api_key = os.environ.get("GOOGLE_API_KEY")
+    if not google_api_key and not STUB_LLM:
+        logger.error("GOOGLE_API_KEY not found in environment variables for General Transformation.")
+        return None, (jsonify({"success": False, "message": "Server configuration error: GOOGLE_API_KEY missing for General Transformation."}), 500)
+    try:
+        return create_llm("gemini-1.5-flash-latest", google_api_key=google_api_key), None
+    except Exception as e:
+        logger.error(f"Failed to initialize LLM for General Transformation: {str(e)}")
+        return None, (jsonify({"success": False, "message": f"Failed to initialize LLM for General Transformation: {str(e)}"}), 500)
+
+def _apply_saved_transformation(data, input_series):
+    """
+    Runs the saved transformation described by the request payload (transformation_type plus
+    transformation_code or transformation_details) over input_series.
+    Returns (outputs, None) or (None, error_response).
+    """
+    transformation_type = data.get('transformation_type')
+
+    if transformation_type == 'General':
+        llm, error_response = _create_general_llm()
+        if error_response:
+            return None, error_response
+
+        transformation_details = data.get('transformation_details')
+        if not transformation_details:
+            return None, (jsonify({"success": False, "message": "Missing 'transformation_details' for General transformation type."}), 400)
+        try:
+            approximate_match_options(data.get('approximate_match'))
+        except ValueError as e:
+            return None, (jsonify({"success": False, "message": str(e)}), 400)
+
+        logger.info(f"Executing General transformation with ID: {transformation_details.get('_id')}, Input Column: {input_series.name}")
+
+        try:
+            gen_trans_result = generate_general_transformation(transformation_details, input_series, llm, approximate_match=data.get('approximate_match'))
+        except Exception as e:
+            logger.error(f"Exception during General transformation call: {str(e)}\n{traceback.format_exc()}")
+            return None, (jsonify({'success': False, 'message': f'Error during general transformation: {str(e)}', 'traceback': traceback.format_exc()}), 500)
+
+        if not gen_trans_result.get('success'):
+            error_msg = gen_trans_result.get('message', 'General transformation failed due to an unknown error.')
+            logger.error(f"General transformation failed: {error_msg}")
+            return None, (jsonify({"success": False, "message": error_msg}), 500)
+
+        # Optionally, provenance (gen_trans_result['provenances']) could be returned as well
+        logger.info(f"General transformation successful. Relationship: {gen_trans_result['relationship']}")
+        return gen_trans_result['outputs'], None
+
+    # For non-General types (e.g., Python, SQL)
+    transformation_code = data.get('transformation_code')
+    if not transformation_code:
+        return None, (jsonify({"success": False, "message": "Missing 'transformation_code' for non-General transformation type."}), 400)
+
+    local_scope = {}
+    exec_globals = {'pd': pd}
+    exec(transformation_code, exec_globals, local_scope)
+
+    transform_func = local_scope.get('transform_value')
+    if not callable(transform_func):
+        for key, value in local_scope.items():
+            if callable(value) and key != '__builtins__':
+                transform_func = value
+                logger.info(f"Found callable function '{key}' in transformation_code, using it.")
+                break
+        if not callable(transform_func):
+            logger.error("No callable function (e.g., 'transform_value') found in the provided transformation_code.")
+            return None, (jsonify({"success": False, "message": "Transformation function (e.g., 'transform_value') not found or is invalid in the provided code."}), 400)
+
+    def apply_transform_safely(value):
+        try:
+            return transform_func(value)
+        except Exception as e:
+            logger.warning(f"Error applying transformation to value '{value}': {str(e)}. Returning original value.")
+            return value
+
+    return apply_transform(input_series, apply_transform_safely, transformation_code), None
+
+def _fuzzy_join_frames(data, source_df, target_df, transformed_source_col, match_only=False):
+    """
+    Validates the join parameters in the payload and joins source_df to target_df, sharded
+    across worker services when configured (see join_shards).
+    Returns (joined_df, None) or (None, error_response); with match_only the first item is
+    (best_indices, best_distances) instead of the joined frame.
+    """
+    target_col_to_join_on = data.get('target_col_to_join_on')
+    transformation_class = data.get('transformation_class')
+    max_distance_threshold = data.get('max_distance_threshold')
+    blocking_columns = data.get('blocking_columns')
+    blocking_keys = data.get('blocking_keys')
+
+    if source_df.empty:
+        return None, (jsonify({'success': False, 'message': 'Source data is empty or invalid.'}), 400)
+    if target_df.empty:
+        return None, (jsonify({'success': False, 'message': 'Target data is empty or invalid.'}), 400)
+
+    if transformed_source_col not in source_df.columns:
+        return None, (jsonify({'success': False, 'message': f"Source column '{transformed_source_col}' not found in source data."}), 400)
+    if target_col_to_join_on not in target_df.columns:
+        return None, (jsonify({'success': False, 'message': f"Target column '{target_col_to_join_on}' not found in target data."}), 400)
+
+    try:
+        threshold_value = float(max_distance_threshold)
+    except (ValueError, TypeError):
+        threshold_value = np.nan
+    if not np.isfinite(threshold_value):
+        return None, (jsonify({'success': False, 'message': 'Max distance threshold must be a valid, finite number.'}), 400)
+
+    try:
+        blocking_columns = normalize_blocking_columns(blocking_columns)
+        blocking_keys = normalize_blocking_keys(blocking_keys)
+    except (ValueError, TypeError) as e:
+        return None, (jsonify({'success': False, 'message': str(e)}), 400)
+    for source_col, target_col in blocking_columns:
+        if source_col not in source_df.columns:
+            return None, (jsonify({'success': False, 'message': f"Blocking column '{source_col}' not found in source data."}), 400)
+        if target_col not in target_df.columns:
+            return None, (jsonify({'success': False, 'message': f"Blocking column '{target_col}' not found in target data."}), 400)
+
+    try:
+        shard_workers = join_shard_workers(data, len(target_df))
+    except ValueError as e:
+        return None, (jsonify({'success': False, 'message': str(e)}), 400)
+    join_args = (source_df, target_df, transformed_source_col, target_col_to_join_on, transformation_class, threshold_value, blocking_columns, blocking_keys)
+    if shard_workers:
+        logger.info(f"Sharding fuzzy join of {len(target_df)} target rows across {len(shard_workers)} workers")
+        try:
+            best_indices, best_distances = sharded_match(*join_args, shard_workers)
+        except ShardJoinError as e:
+            return None, (jsonify({'success': False, 'message': str(e)}), 502)
+    else:
+        best_indices, best_distances = match_fuzzy_join(*join_args)
+    if match_only:
+        return (best_indices, best_distances), None
+
+    joined_df = assemble_joined_frame(source_df, target_df, target_col_to_join_on, best_indices, best_distances)
+    if joined_df is None or not isinstance(joined_df, pd.DataFrame):
+        logger.error(f"assemble_joined_frame returned an unexpected type or None")
+        return None, (jsonify({'success': False, 'message': 'Fuzzy join process resulted in an error or no data.'}), 500)
+    return joined_df, None
+
+def _apply_deduplicated(data, input_series):
+    """
+    Like _apply_saved_transformation, but each distinct non-null value is transformed once
+    and the outputs are mapped back to every row. Returns (outputs, unique_count, error_response).
+    """
+    if pd.api.types.infer_dtype(input_series, skipna=True) not in DEDUPLICATED_DTYPES:
+        outputs, error_response = _apply_saved_transformation(data, input_series)
+        return outputs, len(input_series), error_response
+
+    codes, uniques = pd.factorize(input_series)
+    null_positions = np.flatnonzero(codes == -1)
+    # Nulls are transformed row by row: None and NaN are not guaranteed to map alike
+    distinct_inputs = pd.concat([pd.Series(uniques, dtype=object), input_series.iloc[null_positions].astype(object)], ignore_index=True)
+    distinct_inputs.name = input_series.name
+    distinct_outputs, error_response = _apply_saved_transformation(data, distinct_inputs)
+    if error_response:
+        return None, len(distinct_inputs), error_response
+
+    lookup = np.empty(len(distinct_inputs), dtype=object)
+    for i, value in enumerate(distinct_outputs):
+        lookup[i] = value
+    codes = codes.copy()
+    codes[null_positions] = len(uniques) + np.arange(len(null_positions))
+    return lookup[codes], len(distinct_inputs), None
+
+def _batch_stages(specs):
+    """
+    Groups batch spec indices into stages: a spec whose input column is another spec's output
+    runs in a later stage than that spec. Raises ValueError on a dependency cycle.
+    """
+    producers = {spec['output_column_name']: i for i, spec in enumerate(specs)}
+    remaining = list(range(len(specs)))
+    done, stages = set(), []
+    while remaining:
+        ready = [i for i in remaining
+                 if producers.get(specs[i]['input_column_name'], i) in done | {i}]
+        if not ready:
+            raise ValueError("Transformations depend on each other's outputs in a cycle.")
+        stages.append(ready)
+        done.update(ready)
+        remaining = [i for i in remaining if i not in done]
+    return stages
+
+def _input_frame(data, table_key, plain_columns=()):
+    """
+    The table under table_key ('table_data', 'source_data', 'target_data') as a DataFrame,
+    read from the file named by the matching '*_file' key (table_file, source_file,
+    target_file) when given. Returns (df, None) or (None, error_response).
+    """
+    file_key = table_key.replace('_data', '_file')
+    if data.get(file_key) is not None:
+        try:
+            return read_table_file(data.get(file_key), plain_columns), None
+        except TableInputError as e:
+            return None, (jsonify({"success": False, "message": str(e)}), 400)
+    return records_to_frame(data.get(table_key), plain_columns), None
+
+def _reference_join_frames(data, source_df, transformed_source_col):
+    """
+    Fuzzy joins source_df against the registered reference table named by reference_id.
+    Blocking and distance classes the stored index was not built for use the regular join
+    over the stored table. Returns (joined_df, None) or (None, error_response).
+    """
+    reference_id = data.get('reference_id')
+    try:
+        meta = get_reference_meta(reference_id)
+    except ReferenceNotFound as e:
+        return None, (jsonify({'success': False, 'message': str(e)}), 404)
+    join_column = meta['join_column']
+    if data.get('target_col_to_join_on') not in (None, join_column):
+        return None, (jsonify({'success': False, 'message': f"Reference table '{reference_id}' is indexed on '{join_column}', not '{data.get('target_col_to_join_on')}'."}), 400)
+
+    index = open_reference_index(reference_id)
+    transformation_class = data.get('transformation_class')
+    try:
+        indexed = index_family(transformation_class) == meta['index']
+    except ValueError:
+        indexed = False
+    if not indexed or data.get('blocking_columns') or data.get('blocking_keys'):
+        return _fuzzy_join_frames(dict(data, target_col_to_join_on=join_column), source_df, index.target_frame(), transformed_source_col)
+
+    if source_df.empty:
+        return None, (jsonify({'success': False, 'message': 'Source data is empty or invalid.'}), 400)
+    if transformed_source_col not in source_df.columns:
+        return None, (jsonify({'success': False, 'message': f"Source column '{transformed_source_col}' not found in source data."}), 400)
+    try:
+        threshold_value = float(data.get('max_distance_threshold'))
+    except (ValueError, TypeError):
+        threshold_value = np.nan
+    if not np.isfinite(threshold_value):
+        return None, (jsonify({'success': False, 'message': 'Max distance threshold must be a valid, finite number.'}), 400)
+    return join_reference(index, source_df, transformed_source_col, threshold_value), None
+
+def _records_response(payload, df, records_key='data'):
+    """
+    JSON response carrying df under records_key. The frame is serialized directly with
+    to_json (NaN/inf/missing become null) instead of going through a list of dicts.
+    """
+    members = [f'{json.dumps(str(key))}: {json.dumps(value)}' for key, value in payload.items() if key != records_key]
+    members.append(f'{json.dumps(records_key)}: {frame_to_json_records(df)}')
+    return Response('{' + ', '.join(members) + '}', mimetype='application/json')
+
+def _stored_result_response(payload, df, kind, data):
+    """
+    Saves df to the result store and answers with its result_id and first page only;
+    the remaining pages are fetched from /results/<result_id> with next_cursor.
+    """
+    try:
+        page_size = int(data.get('page_size') or DEFAULT_PAGE_SIZE)
+    except (ValueError, TypeError):
+        page_size = 0
+    if page_size < 1:
+        return jsonify({'success': False, 'message': 'page_size must be a positive integer.'}), 400
+    meta = save_result(df, kind, owner=data.get('result_owner'))
+    page = read_result_page(meta['result_id'], limit=page_size)
+    payload.update({
+        'result_id': meta['result_id'],
+        'total_rows': meta['num_rows'],
+        'columns': meta['columns'],
+        'next_cursor': page['next_cursor']
+    })
+    return _records_response(payload, page['data'])
+
 @app.route('/execute-transformation', methods=['POST'])
+@admitted('execute-transformation', estimate_transformation_cost)
+@profiled
 def execute_transformation_route():
     try:
         data = request.json
@@ -77,174 +368,376 @@ def execute_transformation_route():
         output_column_name = data.get('output_column_name')
         transformation_type = data.get('transformation_type')
         
+        table_file = data.get('table_file')
+
         # Core parameters validation
-        if not all([table_data, input_column_name, output_column_name, transformation_type]):
-            return jsonify({"success": False, "message": "Missing required parameters: table_data, input_column_name, output_column_name, or transformation_type"}), 400
+        if not all([table_data or table_file, input_column_name, output_column_name, transformation_type]):
+            return jsonify({"success": False, "message": "Missing required parameters: table_data (or table_file), input_column_name, output_column_name, or transformation_type"}), 400
 
-        if not isinstance(table_data, list) or not all(isinstance(row, dict) for row in table_data):
+        if table_file is None and (not isinstance(table_data, list) or not all(isinstance(row, dict) for row in table_data)):
             return jsonify({"success": False, "message": "table_data must be a list of dictionaries."}), 400
-        
-        if not table_data:
-             return jsonify({"success": False, "message": "table_data cannot be empty."}), 400
 
-        df = pd.DataFrame(table_data)
+        df, error_response = _input_frame(data, 'table_data', plain_columns=[input_column_name])
+        if error_response:
+            return error_response
+        if df.empty:
+             return jsonify({"success": False, "message": "table_data cannot be empty."}), 400
 
         if input_column_name not in df.columns:
             return jsonify({"success": False, "message": f"Input column '{input_column_name}' not found in the uploaded data."}), 400
 
-        transformed_data_list = []
-
-        llm = None
-        if transformation_type == 'General':
-            google_api_key = os.environ.get("GOOGLE_API_KEY")
-            if not google_api_key:
-                logger.error("GOOGLE_API_KEY not found in environment variables for General Transformation.")
-                return jsonify({"success": False, "message": "Server configuration error: GOOGLE_API_KEY missing for General Transformation."}), 500
+        # Incremental mode only transforms rows inserted or modified since the last run
+        input_series = df[input_column_name]
+        incremental_plan = None
+        if data.get('incremental'):
+            if not data.get('dataset_id'):
+                return jsonify({"success": False, "message": "Missing 'dataset_id' for incremental execution."}), 400
+            transformation_details = data.get('transformation_details') or {}
+            fingerprint = transformation_fingerprint(transformation_type, data.get('transformation_code'), transformation_details, data.get('approximate_match'))
+            transformation_id = data.get('transformation_id') or transformation_details.get('_id') or fingerprint
             try:
-                llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", google_api_key=google_api_key)
-            except Exception as e:
-                logger.error(f"Failed to initialize LLM for General Transformation: {str(e)}")
-                return jsonify({"success": False, "message": f"Failed to initialize LLM for General Transformation: {str(e)}"}), 500
-
-        if transformation_type == 'General':
-            transformation_details = data.get('transformation_details')
-            if not transformation_details:
-                return jsonify({"success": False, "message": "Missing 'transformation_details' for General transformation type."}), 400
-            
-            logger.info(f"Executing General transformation with ID: {transformation_details.get('_id')}, Input Column: {input_column_name}, Output Column: {output_column_name}")
-            
-            try:
-                # Ensure the input column exists before trying to access it
-                if input_column_name not in df.columns:
-                    return jsonify({"success": False, "message": f"Input column '{input_column_name}' not found in the data for General transformation."}), 400
-
-                gen_trans_result = generate_general_transformation(transformation_details, df[input_column_name], llm)
-                
-                if gen_trans_result.get('success'):
-                    df[output_column_name] = gen_trans_result['outputs']
-                    # Optionally, add provenance and relationship if needed for the response
-                    # df['provenance'] = gen_trans_result['provenances']
-                    # df['relationship_detected'] = gen_trans_result['relationship']
-                    transformed_data_list = df.to_dict(orient='records')
-                    logger.info(f"General transformation successful. Relationship: {gen_trans_result['relationship']}")
-                else:
-                    error_msg = gen_trans_result.get('message', 'General transformation failed due to an unknown error.')
-                    logger.error(f"General transformation failed: {error_msg}")
-                    return jsonify({"success": False, "message": error_msg}), 500
-            except Exception as e:
-                logger.error(f"Exception during General transformation call: {str(e)}\n{traceback.format_exc()}")
-                return jsonify({'success': False, 'message': f'Error during general transformation: {str(e)}', 'traceback': traceback.format_exc()}), 500
-
-        else: # For non-General types (e.g., Python, SQL)
-            transformation_code = data.get('transformation_code')
-            if not transformation_code:
-                return jsonify({"success": False, "message": "Missing 'transformation_code' for non-General transformation type."}), 400
-
-            local_scope = {}
-            exec_globals = {'pd': pd} 
-            exec(transformation_code, exec_globals, local_scope)
-            
-            transform_func = local_scope.get('transform_value')
-            if not callable(transform_func):
-                for key, value in local_scope.items():
-                    if callable(value) and key != '__builtins__':
-                        transform_func = value
-                        logger.info(f"Found callable function '{key}' in transformation_code, using it.")
-                        break
-                if not callable(transform_func):
-                     logger.error("No callable function (e.g., 'transform_value') found in the provided transformation_code.")
-                     return jsonify({"success": False, "message": "Transformation function (e.g., 'transform_value') not found or is invalid in the provided code."}), 400
-
-            def apply_transform_safely(value):
-                try:
-                    return transform_func(value)
-                except Exception as e:
-                    logger.warning(f"Error applying transformation to value '{value}': {str(e)}. Returning original value.")
-                    return value
-            
-            df[output_column_name] = df[input_column_name].apply(apply_transform_safely)
-            transformed_data_list = df.to_dict(orient='records')
-
-        return jsonify({"success": True, "data": transformed_data_list, "message": "Transformation executed successfully."})
+                incremental_plan = plan_incremental_run(df, input_column_name, transformation_id, data['dataset_id'], fingerprint, data.get('row_key_columns'))
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+            input_series = input_series.iloc[incremental_plan['changed_positions']]
+            logger.info(f"Incremental execution: {incremental_plan['stats']}")
+
+        outputs = []
+        if incremental_plan is None or len(input_series):
+            outputs, error_response = _apply_saved_transformation(data, input_series)
+            if error_response:
+                return error_response
+
+        if incremental_plan is not None:
+            outputs = complete_incremental_run(incremental_plan, list(outputs))
+        df[output_column_name] = compact_series(pd.Series(outputs, index=df.index), allow_categorical=False)
+
+        response = {"success": True, "message": "Transformation executed successfully."}
+        if incremental_plan is not None:
+            response["incremental"] = incremental_plan['stats']
+        if data.get('store_result'):
+            return _stored_result_response(response, df, 'execute-transformation', data)
+        return _records_response(response, df)
 
     except Exception as e:
         logger.error(f"Error in /execute-transformation: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'success': False, 'message': str(e), 'traceback': traceback.format_exc()}), 500
 
+@app.route('/execute-transformations-batch', methods=['POST'])
+@admitted('execute-transformations-batch', estimate_batch_cost)
+@profiled
+def execute_transformations_batch_route():
+    """
+    Applies several saved transformations to one table in a single request. Each spec in
+    'transformations' carries the /execute-transformation fields (input_column_name,
+    output_column_name, transformation_type, transformation_code or transformation_details).
+    Distinct values are transformed once per spec, independent specs run concurrently, and a
+    spec may read another spec's output column.
+    """
+    try:
+        data = request.json
+        table_data = data.get('table_data')
+        table_file = data.get('table_file')
+        specs = data.get('transformations')
+
+        if not (table_data or table_file) or not specs:
+            return jsonify({"success": False, "message": "Missing required parameters: table_data (or table_file) or transformations"}), 400
+        if table_file is None and (not isinstance(table_data, list) or not all(isinstance(row, dict) for row in table_data)):
+            return jsonify({"success": False, "message": "table_data must be a list of dictionaries."}), 400
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+            return jsonify({"success": False, "message": "transformations must be a list of dictionaries."}), 400
+
+        for i, spec in enumerate(specs):
+            if not all([spec.get('input_column_name'), spec.get('output_column_name'), spec.get('transformation_type')]):
+                return jsonify({"success": False, "message": f"Transformation {i} is missing input_column_name, output_column_name, or transformation_type."}), 400
+        output_columns = [spec['output_column_name'] for spec in specs]
+        if len(set(output_columns)) != len(output_columns):
+            return jsonify({"success": False, "message": "Each transformation must write a different output_column_name."}), 400
+
+        df, error_response = _input_frame(data, 'table_data', plain_columns=[spec['input_column_name'] for spec in specs])
+        if error_response:
+            return error_response
+        for spec in specs:
+            if spec['input_column_name'] not in df.columns and spec['input_column_name'] not in output_columns:
+                return jsonify({"success": False, "message": f"Input column '{spec['input_column_name']}' not found in the uploaded data."}), 400
+
+        try:
+            stages = _batch_stages(specs)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        # Outputs stay plain object arrays until the end so later stages see raw values
+        outputs, summaries = {}, [None] * len(specs)
+        with ThreadPoolExecutor(max_workers=max(1, BATCH_MAX_WORKERS)) as executor:
+            for stage_number, stage in enumerate(stages):
+                futures = {}
+                for i in stage:
+                    input_column_name = specs[i]['input_column_name']
+                    if input_column_name in outputs:
+                        input_series = pd.Series(outputs[input_column_name], index=df.index, name=input_column_name)
+                    else:
+                        input_series = df[input_column_name]
+                    task = copy_current_request_context(_apply_deduplicated)
+                    futures[i] = executor.submit(task, specs[i], input_series)
+                for i, future in futures.items():
+                    spec_outputs, unique_count, error_response = future.result()
+                    if error_response:
+                        logger.error(f"Batch transformation {i} ({specs[i]['output_column_name']}) failed")
+                        return error_response
+                    outputs[specs[i]['output_column_name']] = spec_outputs
+                    summaries[i] = {
+                        'output_column_name': specs[i]['output_column_name'],
+                        'stage': stage_number,
+                        'distinct_inputs': unique_count
+                    }
+
+        for output_column_name in output_columns:
+            df[output_column_name] = compact_series(pd.Series(outputs[output_column_name], index=df.index), allow_categorical=False)
+
+        response = {"success": True, "message": f"{len(specs)} transformations executed successfully.", "transformations": summaries}
+        if data.get('store_result'):
+            return _stored_result_response(response, df, 'execute-transformations-batch', data)
+        return _records_response(response, df)
+
+    except Exception as e:
+        logger.error(f"Error in /execute-transformations-batch: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'success': False, 'message': str(e), 'traceback': traceback.format_exc()}), 500
+
 @app.route('/fuzzy-join', methods=['POST'])
+@admitted('fuzzy-join', estimate_join_cost)
+@profiled
 def fuzzy_join_route():
     try:
         data = request.json
-        source_data = data.get('source_data')
-        target_data = data.get('target_data')
         transformed_source_col = data.get('transformed_source_col')
-        target_col_to_join_on = data.get('target_col_to_join_on')
-        transformation_class = data.get('transformation_class')
-        max_distance_threshold = data.get('max_distance_threshold')
 
+        # A registered reference table (reference_id) replaces target_data and target_col_to_join_on
+        reference_id = data.get('reference_id')
         if not all([
-            data.get('source_data') is not None, 
-            data.get('target_data') is not None, 
+            data.get('source_data') is not None or data.get('source_file') is not None, 
+            data.get('target_data') is not None or data.get('target_file') is not None or reference_id, 
             data.get('transformed_source_col'), 
-            data.get('target_col_to_join_on'), 
+            data.get('target_col_to_join_on') or reference_id, 
             data.get('transformation_class'), 
             data.get('max_distance_threshold') is not None
         ]):
             return jsonify({'success': False, 'message': 'Missing one or more required parameters.'}), 400
 
-        source_df = pd.DataFrame(source_data)
-        target_df = pd.DataFrame(target_data)
+        source_df, error_response = _input_frame(data, 'source_data')
+        if error_response:
+            return error_response
+        if reference_id and data.get('target_data') is None and data.get('target_file') is None:
+            joined_df, error_response = _reference_join_frames(data, source_df, transformed_source_col)
+        else:
+            target_df, error_response = _input_frame(data, 'target_data')
+            if error_response:
+                return error_response
+            if data.get('return_match_indices'):
+                # Shard request from a coordinator: positional matches only
+                matches, error_response = _fuzzy_join_frames(data, source_df, target_df, transformed_source_col, match_only=True)
+                return error_response or jsonify(match_indices_payload(*matches))
+            joined_df, error_response = _fuzzy_join_frames(data, source_df, target_df, transformed_source_col)
+        if error_response:
+            return error_response
+
+        if data.get('store_result'):
+            return _stored_result_response({'success': True}, joined_df, 'fuzzy-join', data)
+        return _records_response({'success': True}, joined_df)
+    except Exception as e:
+        logger.error(f"Error in /fuzzy-join: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'success': False, 'message': str(e), 'traceback': traceback.format_exc()}), 500
 
-        if source_df.empty:
-            return jsonify({'success': False, 'message': 'Source data is empty or invalid.'}), 400
-        if target_df.empty:
-            return jsonify({'success': False, 'message': 'Target data is empty or invalid.'}), 400
-        
-        if transformed_source_col not in source_df.columns:
-            return jsonify({'success': False, 'message': f"Source column '{transformed_source_col}' not found in source data."}), 400
-        if target_col_to_join_on not in target_df.columns:
-            return jsonify({'success': False, 'message': f"Target column '{target_col_to_join_on}' not found in target data."}), 400
+@app.route('/transform-and-join', methods=['POST'])
+@admitted('transform-and-join', estimate_transform_and_join_cost)
+@profiled
+def transform_and_join_route():
+    """
+    Applies a saved transformation to the source column and fuzzy joins the result against
+    the target table in one request, so the transformed table never leaves the process.
+    Only the joined rows are returned: one page (page/page_size) or, with stream=true,
+    the whole result as newline-delimited JSON.
+    """
+    try:
+        data = request.json
+        source_data = data.get('source_data')
+        target_data = data.get('target_data')
+        input_column_name = data.get('input_column_name')
+        output_column_name = data.get('output_column_name') or f'transformed_{input_column_name}'
+
+        if not all([
+            source_data or data.get('source_file'),
+            target_data or data.get('target_file'),
+            input_column_name,
+            data.get('transformation_type'),
+            data.get('target_col_to_join_on'),
+            data.get('transformation_class'),
+            data.get('max_distance_threshold') is not None
+        ]):
+            return jsonify({'success': False, 'message': 'Missing one or more required parameters.'}), 400
+
+        if data.get('source_file') is None and (not isinstance(source_data, list) or not all(isinstance(row, dict) for row in source_data)):
+            return jsonify({"success": False, "message": "source_data must be a list of dictionaries."}), 400
 
         try:
-            threshold_value = float(max_distance_threshold)
-        except ValueError:
-            return jsonify({'success': False, 'message': 'Max distance threshold must be a valid number.'}), 400
-
-        joined_df = perform_fuzzy_join(
-            source_df,
-            target_df,
-            transformed_source_col,
-            target_col_to_join_on,
-            transformation_class,
-            threshold_value
-        )
-        
-        if joined_df is None or not isinstance(joined_df, pd.DataFrame):
-             logger.error(f"perform_fuzzy_join returned an unexpected type or None")
-             return jsonify({'success': False, 'message': 'Fuzzy join process resulted in an error or no data.'}), 500
+            page = int(data.get('page', 1))
+            page_size = int(data.get('page_size', 0))
+        except (ValueError, TypeError):
+            return jsonify({'success': False, 'message': 'page and page_size must be integers.'}), 400
+        if page < 1 or page_size < 0:
+            return jsonify({'success': False, 'message': 'page must be at least 1 and page_size cannot be negative.'}), 400
+
+        source_df, error_response = _input_frame(data, 'source_data', plain_columns=[input_column_name])
+        if error_response:
+            return error_response
+        target_df, error_response = _input_frame(data, 'target_data')
+        if error_response:
+            return error_response
+
+        if input_column_name not in source_df.columns:
+            return jsonify({"success": False, "message": f"Input column '{input_column_name}' not found in the source data."}), 400
+
+        outputs, error_response = _apply_saved_transformation(data, source_df[input_column_name])
+        if error_response:
+            return error_response
+        source_df[output_column_name] = compact_series(pd.Series(outputs, index=source_df.index), allow_categorical=False)
+
+        joined_df, error_response = _fuzzy_join_frames(data, source_df, target_df, output_column_name)
+        if error_response:
+            return error_response
+
+        if data.get('store_result'):
+            return _stored_result_response({'success': True}, joined_df, 'transform-and-join', data)
+
+        total_rows = len(joined_df)
+        if data.get('stream'):
+            def generate_rows(chunk_size=1000):
+                for start in range(0, total_rows, chunk_size):
+                    yield joined_df.iloc[start:start + chunk_size].to_json(orient='records', lines=True, date_format='iso', double_precision=15).rstrip('\n') + '\n'
+            return Response(stream_with_context(generate_rows()), mimetype='application/x-ndjson', headers={'X-Total-Rows': str(total_rows)})
+
+        # page_size 0 returns every joined row
+        if page_size:
+            joined_df = joined_df.iloc[(page - 1) * page_size:page * page_size]
+        return _records_response({
+            'success': True,
+            'total_rows': total_rows,
+            'page': page if page_size else 1,
+            'page_size': page_size or total_rows
+        }, joined_df)
+    except Exception as e:
+        logger.error(f"Error in /transform-and-join: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'success': False, 'message': str(e), 'traceback': traceback.format_exc()}), 500
 
-        # Convert DataFrame to a list of dictionaries, ensuring NaN becomes null for JSON
-        if joined_df.empty:
-            data_list = []
-        else:
-            # Pandas to_json converts NaN to null, then json.loads converts null to None (Python)
-            # jsonify will then convert None to null in the final JSON string.
-            # Using date_format='iso' for consistent datetime serialization if any.
-            json_string_data = joined_df.to_json(orient='records', date_format='iso')
-            data_list = json.loads(json_string_data)
+@app.route('/reference-tables', methods=['POST'])
+def register_reference_table_route():
+    """
+    Registers a reference table for repeated /fuzzy-join calls: target_data is stored with a
+    join index on join_column for transformation_class, and later joins pass the returned
+    reference_id instead of target_data.
+    """
+    try:
+        data = request.json
+        target_data = data.get('target_data')
+        target_file = data.get('target_file')
+        join_column = data.get('join_column') or data.get('target_col_to_join_on')
+        transformation_class = data.get('transformation_class')
+
+        if not all([target_data or target_file, join_column, transformation_class]):
+            return jsonify({'success': False, 'message': 'Missing required parameters: target_data (or target_file), join_column, or transformation_class'}), 400
+        if target_file is None and (not isinstance(target_data, list) or not all(isinstance(row, dict) for row in target_data)):
+            return jsonify({'success': False, 'message': 'target_data must be a list of dictionaries.'}), 400
 
-        return jsonify({'success': True, 'data': data_list})
+        target_df, error_response = _input_frame(data, 'target_data')
+        if error_response:
+            return error_response
+        try:
+            meta = register_reference_table(target_df, join_column, transformation_class)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        logger.info(f"Registered reference table {meta['reference_id']}: {meta['num_rows']} rows, {meta['index']} index on '{join_column}'")
+        return jsonify(dict(meta, success=True))
     except Exception as e:
-        logger.error(f"Error in /fuzzy-join: {str(e)}")
+        logger.error(f"Error in /reference-tables: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'success': False, 'message': str(e), 'traceback': traceback.format_exc()}), 500
 
+@app.route('/reference-tables/<reference_id>', methods=['GET'])
+def get_reference_table_route(reference_id):
+    try:
+        return jsonify(dict(get_reference_meta(reference_id), success=True))
+    except ReferenceNotFound as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
+
+@app.route('/reference-tables/<reference_id>', methods=['DELETE'])
+def delete_reference_table_route(reference_id):
+    try:
+        get_reference_meta(reference_id)
+    except ReferenceNotFound as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
+    delete_reference_table(reference_id)
+    return jsonify({'success': True, 'message': f"Reference table '{reference_id}' deleted."})
+
+def _check_result_owner(result_id):
+    # Results saved with a result_owner are only visible to requests passing the same ?owner=
+    meta = get_result_meta(result_id)
+    if meta.get('owner') is not None and request.args.get('owner') != meta['owner']:
+        raise ResultNotFound(f"Result '{result_id}' not found.")
+
+@app.route('/results/<result_id>', methods=['GET'])
+def get_result_page(result_id):
+    """
+    Pages through a stored result: ?cursor=&limit=&columns=a,b&filter_column=&filter_value=&filter_op=eq|ne|contains&owner=
+    """
+    try:
+        _check_result_owner(result_id)
+        columns = [col for col in request.args.get('columns', '').split(',') if col] or None
+        page = read_result_page(
+            result_id,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE),
+            columns=columns,
+            filter_column=request.args.get('filter_column'),
+            filter_value=request.args.get('filter_value', ''),
+            filter_op=request.args.get('filter_op', 'eq')
+        )
+    except ResultNotFound as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in /results/{result_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'success': False, 'message': str(e), 'traceback': traceback.format_exc()}), 500
+    return _records_response({
+        'success': True,
+        'result_id': result_id,
+        'total_rows': page['total_rows'],
+        'next_cursor': page['next_cursor']
+    }, page['data'])
+
+@app.route('/results/<result_id>', methods=['DELETE'])
+def delete_result_route(result_id):
+    try:
+        _check_result_owner(result_id)
+    except ResultNotFound as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
+    delete_result(result_id)
+    return jsonify({'success': True, 'message': f"Result '{result_id}' deleted."})
+
 # Add a simple health check endpoint
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "ok", "message": "Flask server is running"})
 
+# Admission queue depth and in-flight work, in Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(admission_controller.metrics_text(), mimetype='text/plain; version=0.0.4')
+
 # Add a catch-all route for debugging
 @app.route('/', defaults={'path': ''}, methods=['GET', 'POST'])
 @app.route('/<path:path>', methods=['GET', 'POST'])
@@ -252,11 +745,11 @@ def catch_all(path):
     if path and path != '/':
         return jsonify({
             "error": True,
-            "message": f"Endpoint /{path} not found. Available endpoints: /execute-transformation, /apply, /classify, /fuzzy-join, /health"
+            "message": f"Endpoint /{path} not found. Available endpoints: /execute-transformation, /execute-transformations-batch, /apply, /classify, /fuzzy-join, /transform-and-join, /reference-tables, /results/<result_id>, /metrics, /health"
         }), 404
     return jsonify({
         "message": "TabulaX Flask API Server",
-        "endpoints": ["/execute-transformation", "/apply", "/classify", "/fuzzy-join", "/health"],
+        "endpoints": ["/execute-transformation", "/execute-transformations-batch", "/apply", "/classify", "/fuzzy-join", "/transform-and-join", "/reference-tables", "/results/<result_id>", "/metrics", "/health"],
         "status": "running"
     })
 
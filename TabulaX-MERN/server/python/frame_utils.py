@@ -0,0 +1,86 @@
+import json
+import math
+import pandas as pd
+
+ARROW_STRING_DTYPE = pd.StringDtype("pyarrow")
+
+# Columns with at most this share of distinct values are dictionary-encoded as categoricals
+CATEGORICAL_MAX_UNIQUE_RATIO = 0.5
+CATEGORICAL_MIN_ROWS = 64
+
+def compact_series(series, allow_categorical=True):
+    """
+    Converts an object column of strings to Arrow-backed storage (one buffer instead of a
+    Python object per value) and low-cardinality string columns to categoricals.
+    Non-string columns are returned unchanged.
+    """
+    if series.dtype == object:
+        if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+            return series
+        series = series.astype(ARROW_STRING_DTYPE)
+    elif not pd.api.types.is_string_dtype(series.dtype):
+        return series
+
+    if allow_categorical and len(series) >= CATEGORICAL_MIN_ROWS:
+        if series.nunique(dropna=True) <= CATEGORICAL_MAX_UNIQUE_RATIO * len(series):
+            return series.astype('category')
+    return series
+
+def records_to_frame(records, plain_columns=()):
+    """
+    Builds a DataFrame from a list of row dicts with compact string storage.
+    Columns in plain_columns keep their inferred dtype, for columns that are handed to
+    user transformation functions and must see the same values as before.
+    """
+    df = pd.DataFrame(records)
+    for col in df.columns:
+        if col not in plain_columns:
+            df[col] = compact_series(df[col])
+    return df
+
+def _is_missing(val):
+    return val is None or val is pd.NA or val is pd.NaT or (isinstance(val, float) and math.isnan(val))
+
+def encode_json_columns(df):
+    """
+    Copy of df with string column names and each mixed object column (Arrow needs one type
+    per column) replaced by its values' JSON text. Returns (df, encoded column names);
+    table_to_frame restores the values from the names.
+    """
+    df = df.rename(columns=str)
+    json_columns = [col for col in df.columns
+                    if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ('string', 'empty')]
+    for col in json_columns:
+        df[col] = [None if _is_missing(val) else json.dumps(val, default=str) for val in df[col]]
+    return df, json_columns
+
+def table_to_frame(table, json_columns=()):
+    """
+    An Arrow table as a DataFrame, decoding the columns encode_json_columns stored as JSON.
+    """
+    df = table.to_pandas()
+    for col in json_columns:
+        if col in table.column_names:
+            values = [None if val is None else json.loads(val) for val in table.column(col).to_pylist()]
+            df[col] = pd.Series(values, index=df.index, dtype=object)
+    return df
+
+def arrow_safe_frame(df):
+    """
+    Copy of df that Arrow/Parquet can store: column names become strings and mixed object
+    columns (Arrow needs one type per column) are stored as strings.
+    """
+    df = df.rename(columns=str)
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ('string', 'empty'):
+            df[col] = df[col].map(lambda val: None if pd.isna(val) else str(val))
+    return df
+
+def frame_to_json_records(df):
+    """
+    Serializes a DataFrame straight to a JSON array of row objects without building
+    intermediate Python dicts. NaN, inf and missing values become null.
+    """
+    if df.empty:
+        return '[]'
+    return df.to_json(orient='records', date_format='iso', double_precision=15)
@@ -1,6 +1,24 @@
+import os
+import math
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 import Levenshtein
+from rapidfuzz import process as rf_process
+from rapidfuzz.distance import Levenshtein as rf_levenshtein
+
+STRING_CLASSES = ["String-based", "Algorithmic"]
+NUMERICAL_CLASSES = ["Numerical"]
+
+# Upper bound on the number of source x target cells scored at once, keeps the
+# distance matrix for one block around 32MB of float64.
+SCORE_BLOCK_CELLS = 4_000_000
+
+BLOCKING_KEY_TYPES = ["prefix", "length_bucket", "soundex"]
+
+SOUNDEX_CODES = {letter: digit for digit, letters in {
+    '1': 'BFPV', '2': 'CGJKQSXZ', '3': 'DT', '4': 'L', '5': 'MN', '6': 'R'
+}.items() for letter in letters}
 
 def calculate_distance(val1, val2, transformation_class):
     """
@@ -22,49 +40,298 @@ def calculate_distance(val1, val2, transformation_class):
     # Add other transformation classes if needed
     return np.inf # Default for unknown classes
 
-def perform_fuzzy_join(source_df, target_df, transformed_source_col, target_col_to_join_on, transformation_class, max_distance_threshold):
+def _resolve_workers(workers):
+    if workers is None or workers < 1:
+        return os.cpu_count() or 1
+    return workers
+
+def _score_string_block(source_values, target_values, max_distance_threshold, workers):
+    source_values = np.asarray(source_values, dtype=object)
+    target_values = np.asarray(target_values, dtype=object)
+    source_missing = pd.isna(source_values)
+    target_missing = pd.isna(target_values)
+    source_strings = ["" if missing else str(val) for val, missing in zip(source_values, source_missing)]
+    target_strings = ["" if missing else str(val) for val, missing in zip(target_values, target_missing)]
+
+    # Levenshtein distance never exceeds the longer string's length, so a larger
+    # cutoff buys nothing and only risks overflowing the integer cutoff.
+    longest = max(max(map(len, source_strings), default=0), max(map(len, target_strings), default=0))
+    score_cutoff = int(math.floor(min(max_distance_threshold, longest)))
+
+    # Pairs above the cutoff come back as score_cutoff + 1 without finishing the DP
+    distances = rf_process.cdist(
+        source_strings,
+        target_strings,
+        scorer=rf_levenshtein.distance,
+        score_cutoff=score_cutoff,
+        dtype=np.int32,
+        workers=workers
+    ).astype(np.float64)
+    distances[distances > max_distance_threshold] = np.inf
+    distances[source_missing, :] = np.inf
+    distances[:, target_missing] = np.inf
+    return distances
+
+def _numeric_array(values):
+    if isinstance(values, np.ndarray) and values.dtype == np.float64:
+        return values
+    return pd.to_numeric(pd.Series(np.asarray(values, dtype=object)), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+def join_key_array(series, transformation_class):
     """
-    Performs a fuzzy left join between two DataFrames based on a calculated distance.
+    Coerces a join column into a side array for scoring, leaving the DataFrame untouched:
+    strings (None for missing) for string classes, float64 (NaN when not numeric) otherwise.
+    Missing keys never match, on either side; they are not compared as "nan"/"None".
+    """
+    if transformation_class in STRING_CLASSES:
+        return np.array([None if pd.isna(val) else str(val) for val in series], dtype=object)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+def _score_numerical_rows(source_nums, target_nums, max_distance_threshold):
+    distances = np.abs(source_nums[:, None] - target_nums[None, :])
+    distances[np.isnan(distances) | (distances > max_distance_threshold)] = np.inf
+    return distances
+
+def _score_numerical_block(source_values, target_values, max_distance_threshold, workers):
+    source_nums = _numeric_array(source_values)
+    target_nums = _numeric_array(target_values)
+
+    if workers == 1 or len(source_nums) < 2 * workers:
+        return _score_numerical_rows(source_nums, target_nums, max_distance_threshold)
+
+    # NumPy releases the GIL inside the ufuncs, so row slices score in parallel
+    row_slices = np.array_split(np.arange(len(source_nums)), workers)
+    distances = np.empty((len(source_nums), len(target_nums)), dtype=np.float64)
+    def score_slice(rows):
+        if len(rows):
+            distances[rows[0]:rows[-1] + 1] = _score_numerical_rows(source_nums[rows[0]:rows[-1] + 1], target_nums, max_distance_threshold)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(score_slice, row_slices))
+    return distances
+
+def score_distance_block(source_values, target_values, transformation_class, max_distance_threshold, workers=-1):
+    """
+    Scores a block of source values against a block of target values in one call.
+    Returns a float64 array of shape (len(source_values), len(target_values)) holding the
+    same distances as calculate_distance, with np.inf for missing values and for every
+    pair whose distance exceeds max_distance_threshold. workers=-1 uses all cores.
+    """
+    shape = (len(source_values), len(target_values))
+    if shape[0] == 0 or shape[1] == 0 or max_distance_threshold < 0:
+        return np.full(shape, np.inf)
+
+    workers = _resolve_workers(workers)
+    if transformation_class in STRING_CLASSES:
+        return _score_string_block(source_values, target_values, max_distance_threshold, workers)
+    elif transformation_class in NUMERICAL_CLASSES:
+        return _score_numerical_block(source_values, target_values, max_distance_threshold, workers)
+    return np.full(shape, np.inf) # Default for unknown classes
+
+def find_best_matches(source_values, target_values, transformation_class, max_distance_threshold, workers=-1):
+    """
+    Finds the closest target for every source value, scoring block by block.
+    Returns (best_indices, best_distances): positional target indices (-1 when nothing is
+    within max_distance_threshold) and the matching distances (np.inf when unmatched).
+    Ties go to the earliest target, as in the row-by-row scan.
+    """
+    source_values = np.asarray(source_values)
+    target_values = np.asarray(target_values)
+    best_indices = np.full(len(source_values), -1, dtype=np.int64)
+    best_distances = np.full(len(source_values), np.inf)
+    if len(source_values) == 0 or len(target_values) == 0:
+        return best_indices, best_distances
+
+    block_rows = max(1, SCORE_BLOCK_CELLS // len(target_values))
+    for start in range(0, len(source_values), block_rows):
+        stop = min(start + block_rows, len(source_values))
+        distances = score_distance_block(source_values[start:stop], target_values, transformation_class, max_distance_threshold, workers)
+        block_best = np.argmin(distances, axis=1)
+        block_distances = distances[np.arange(stop - start), block_best]
+        matched = np.isfinite(block_distances)
+        best_indices[start:stop] = np.where(matched, block_best, -1)
+        best_distances[start:stop] = block_distances
+    return best_indices, best_distances
+
+def soundex(value):
+    """
+    American Soundex code of a value (e.g. "Robert" -> "R163"), or None if it has no letters.
+    """
+    letters = [c for c in str(value).upper() if c.isascii() and c.isalpha()]
+    if not letters:
+        return None
+    code = letters[0]
+    last_digit = SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != last_digit:
+            code += digit
+            if len(code) == 4:
+                break
+        if letter not in 'HW': # H and W do not separate letters with the same code
+            last_digit = digit
+    return code.ljust(4, '0')
+
+def normalize_blocking_columns(blocking_columns):
     """
-    # Ensure columns are of appropriate type for distance calculation
-    source_df[transformed_source_col] = source_df[transformed_source_col].astype(str) if transformation_class in ["String-based", "Algorithmic"] else pd.to_numeric(source_df[transformed_source_col], errors='coerce')
-    target_df[target_col_to_join_on] = target_df[target_col_to_join_on].astype(str) if transformation_class in ["String-based", "Algorithmic"] else pd.to_numeric(target_df[target_col_to_join_on], errors='coerce')
-
-    # Create a new DataFrame for results
-    joined_data = []
-
-    # Iterate through each row in the source DataFrame
-    for idx_s, row_s in source_df.iterrows():
-        source_val = row_s[transformed_source_col]
-        best_match_row = None
-        min_distance = np.inf
-
-        # Find the best match in the target DataFrame
-        for idx_t, row_t in target_df.iterrows():
-            target_val = row_t[target_col_to_join_on]
-            distance = calculate_distance(source_val, target_val, transformation_class)
-
-            if distance <= max_distance_threshold and distance < min_distance:
-                min_distance = distance
-                best_match_row = row_t.to_dict()
-
-        # Combine source row with best match from target
-        combined_row = row_s.to_dict()
-        if best_match_row:
-            # Add target columns, prefixing to avoid name conflicts
-            for key, value in best_match_row.items():
-                if key != target_col_to_join_on: # Don't duplicate the join key from target
-                    combined_row[f'target_{key}'] = value
-            combined_row[f'target_{target_col_to_join_on}'] = best_match_row[target_col_to_join_on] # Add the joined-on column
-            combined_row['join_distance'] = min_distance
+    Turns the blocking_columns parameter into a list of (source column, target column) pairs.
+    Each entry is either a column name present on both sides or a [source, target] pair.
+    """
+    if not blocking_columns:
+        return []
+    if isinstance(blocking_columns, str):
+        blocking_columns = [blocking_columns]
+    pairs = []
+    for entry in blocking_columns:
+        if isinstance(entry, str):
+            pairs.append((entry, entry))
+        elif isinstance(entry, (list, tuple)) and len(entry) == 2 and all(isinstance(col, str) for col in entry):
+            pairs.append((entry[0], entry[1]))
         else:
-            # If no match, add NaN for target columns and infinite distance
-            for col in target_df.columns:
-                combined_row[f'target_{col}'] = np.nan
-            combined_row['join_distance'] = np.inf
+            raise ValueError(f"Invalid blocking column '{entry}'. Use a column name or a [source_column, target_column] pair.")
+    return pairs
+
+def _blocking_key_size(spec, field):
+    value = spec.get(field, 1)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, str) and value.strip().isascii() and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"Blocking key '{spec['type']}' needs '{field}' to be a whole number of at least 1, got {value!r}.")
+    return value
+
+def normalize_blocking_keys(blocking_keys):
+    """
+    Validates derived blocking key specs such as {"type": "prefix", "length": 3},
+    {"type": "length_bucket", "size": 5} or {"type": "soundex"} ("soundex" alone also works).
+    """
+    if not blocking_keys:
+        return []
+    if isinstance(blocking_keys, (str, dict)):
+        blocking_keys = [blocking_keys]
+    specs = []
+    for entry in blocking_keys:
+        spec = {'type': entry} if isinstance(entry, str) else dict(entry) if isinstance(entry, dict) else {}
+        key_type = spec.get('type')
+        if key_type not in BLOCKING_KEY_TYPES:
+            raise ValueError(f"Invalid blocking key '{entry}'. Supported types: {', '.join(BLOCKING_KEY_TYPES)}.")
+        if key_type == 'prefix':
+            spec['length'] = _blocking_key_size(spec, 'length')
+        elif key_type == 'length_bucket':
+            spec['size'] = _blocking_key_size(spec, 'size')
+        specs.append(spec)
+    return specs
+
+def derive_blocking_key(values, spec):
+    """
+    Computes a derived blocking key for each join column value; missing values get None.
+    """
+    def key_of(val):
+        if pd.isna(val):
+            return None
+        val = str(val)
+        if spec['type'] == 'prefix':
+            return val[:spec['length']]
+        elif spec['type'] == 'length_bucket':
+            return len(val) // spec['size']
+        return soundex(val)
+    return np.array([key_of(val) for val in values], dtype=object)
+
+def _blocking_value(val):
+    # Integral floats compare equal to ints (2020.0 from a column with nulls vs 2020)
+    if pd.isna(val):
+        return None
+    if isinstance(val, (float, np.floating)) and float(val).is_integer():
+        return str(int(val))
+    return str(val)
+
+def _blocking_groups(df, join_values, columns, derived_keys):
+    # Maps each blocking key to the positions of the rows that carry it. Rows with a
+    # missing key are left out of every block and therefore never match.
+    keys = {}
+    for i, col in enumerate(columns):
+        keys[f'column_{i}'] = np.array([_blocking_value(val) for val in df[col]], dtype=object)
+    for i, spec in enumerate(derived_keys):
+        keys[f'derived_{i}'] = derive_blocking_key(join_values, spec)
+    key_frame = pd.DataFrame(keys, dtype=object)
+    return key_frame.groupby(list(key_frame.columns), sort=False, dropna=True).indices
+
+def find_best_matches_blocked(source_df, target_df, source_values, target_values, transformation_class, max_distance_threshold, blocking_columns, blocking_keys):
+    """
+    Same result contract as find_best_matches, but a source row is only scored against the
+    target rows sharing all of its blocking keys, one small block at a time. source_values
+    and target_values are the coerced join keys (see join_key_array).
+    """
+    best_indices = np.full(len(source_df), -1, dtype=np.int64)
+    best_distances = np.full(len(source_df), np.inf)
 
-        joined_data.append(combined_row)
+    source_groups = _blocking_groups(source_df, source_values, [src for src, _ in blocking_columns], blocking_keys)
+    target_groups = _blocking_groups(target_df, target_values, [tgt for _, tgt in blocking_columns], blocking_keys)
+    for key, source_positions in source_groups.items():
+        target_positions = target_groups.get(key)
+        if target_positions is None:
+            continue
+        block_indices, block_distances = find_best_matches(source_values[source_positions], target_values[target_positions], transformation_class, max_distance_threshold)
+        matched = block_indices >= 0
+        best_indices[source_positions[matched]] = target_positions[block_indices[matched]]
+        best_distances[source_positions] = block_distances
+    return best_indices, best_distances
 
-    # Convert the list of dicts to a DataFrame
-    joined_df = pd.DataFrame(joined_data)
+def assemble_joined_frame(source_df, target_df, target_col_to_join_on, best_indices, best_distances):
+    """
+    Builds the fuzzy join output from the match arrays (best_indices[i] is the target position
+    matched by source row i, or -1). Columns are the source columns, the target columns
+    prefixed with 'target_' (the joined-on column last) and join_distance. Unmatched rows get
+    NaN target values and an infinite distance. Source columns with the same name as an
+    output target column are replaced by it.
+    """
+    best_indices = np.asarray(best_indices, dtype=np.int64)
+    target_columns = [col for col in target_df.columns if col != target_col_to_join_on] + [target_col_to_join_on]
+    # Reindexing by position turns -1 into all-NaN rows in one vectorized step
+    target_part = target_df[target_columns].reset_index(drop=True).reindex(best_indices)
+    target_part.columns = [f'target_{col}' for col in target_columns]
+    target_part.index = pd.RangeIndex(len(best_indices))
+
+    output_columns = set(target_part.columns) | {'join_distance'}
+    source_part = source_df.reset_index(drop=True)
+    source_part = source_part[[col for col in source_part.columns if col not in output_columns]]
+
+    joined_df = pd.concat([source_part, target_part], axis=1)
+    joined_df['join_distance'] = np.where(best_indices >= 0, best_distances, np.inf)
     return joined_df
+
+def match_fuzzy_join(source_df, target_df, transformed_source_col, target_col_to_join_on, transformation_class, max_distance_threshold, blocking_columns=None, blocking_keys=None):
+    """
+    The matching half of perform_fuzzy_join: (best_indices, best_distances) as returned by
+    find_best_matches, with blocking applied when given.
+    """
+    blocking_columns = normalize_blocking_columns(blocking_columns)
+    blocking_keys = normalize_blocking_keys(blocking_keys)
+
+    # Coerce the join columns into side arrays; the caller's DataFrames are not modified
+    source_values = join_key_array(source_df[transformed_source_col], transformation_class)
+    target_values = join_key_array(target_df[target_col_to_join_on], transformation_class)
+
+    # Score all pairs in batches, then pick the best target for each source row
+    if blocking_columns or blocking_keys:
+        best_indices, best_distances = find_best_matches_blocked(
+            source_df, target_df, source_values, target_values,
+            transformation_class, max_distance_threshold, blocking_columns, blocking_keys
+        )
+    else:
+        best_indices, best_distances = find_best_matches(source_values, target_values, transformation_class, max_distance_threshold)
+    return best_indices, best_distances
+
+def perform_fuzzy_join(source_df, target_df, transformed_source_col, target_col_to_join_on, transformation_class, max_distance_threshold, blocking_columns=None, blocking_keys=None):
+    """
+    Performs a fuzzy left join between two DataFrames based on a calculated distance.
+    When blocking_columns and/or blocking_keys are given, only rows whose blocking
+    keys are equal on both sides are compared.
+    """
+    best_indices, best_distances = match_fuzzy_join(
+        source_df, target_df, transformed_source_col, target_col_to_join_on,
+        transformation_class, max_distance_threshold, blocking_columns, blocking_keys
+    )
+    return assemble_joined_frame(source_df, target_df, target_col_to_join_on, best_indices, best_distances)
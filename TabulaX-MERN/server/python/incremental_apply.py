@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import pandas as pd
+
+# Per-row state of previous runs lives here, one JSON file per (transformation, dataset).
+# States unused for INCREMENTAL_STATE_TTL_S are evicted, then the least recently used ones
+# until the directory fits in INCREMENTAL_STATE_MAX_BYTES.
+INCREMENTAL_STATE_DIR = os.environ.get(
+    "TABULAX_INCREMENTAL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "incremental_state")
+)
+INCREMENTAL_STATE_TTL_S = float(os.environ.get("TABULAX_INCREMENTAL_TTL_S", str(30 * 24 * 3600)))
+INCREMENTAL_STATE_MAX_BYTES = float(os.environ.get("TABULAX_INCREMENTAL_MAX_BYTES", str(1024 ** 3)))
+
+_eviction_lock = threading.Lock()
+
+def _json_default(value):
+    # NumPy scalars and other stragglers returned by transformation functions
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+def transformation_fingerprint(transformation_type, transformation_code=None, transformation_details=None, approximate_match=None):
+    """
+    Hash of everything that decides a transformation's output, so a saved state is
+    discarded as soon as the code, the examples or the example matching options change.
+    """
+    details = transformation_details or {}
+    payload = json.dumps({
+        'type': transformation_type,
+        'code': transformation_code,
+        'sourceExamples': details.get('sourceExamples'),
+        'targetExamples': details.get('targetExamples'),
+        'approximateMatch': approximate_match
+    }, sort_keys=True, default=_json_default)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _state_path(transformation_id, dataset_id):
+    name = hashlib.sha256(f"{transformation_id}\0{dataset_id}".encode('utf-8')).hexdigest()
+    return os.path.join(INCREMENTAL_STATE_DIR, f"{name}.json")
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        os.utime(path) # the modification time doubles as the last use for eviction
+        return state
+    except (OSError, ValueError):
+        return None # A corrupt state only costs a full recompute
+
+def _typed_hashes(frame):
+    # Each value's type is hashed with its text, so 1 and '1' or None and 'None' differ
+    parts = {}
+    for i, col in enumerate(frame.columns):
+        values = frame[col]
+        if values.dtype == object:
+            parts[f'type{i}'] = values.map(lambda value: type(value).__name__)
+        else:
+            parts[f'type{i}'] = pd.Series(str(values.dtype), index=values.index)
+        parts[f'missing{i}'] = values.isna()
+        parts[f'value{i}'] = values.astype(str)
+    return [str(h) for h in pd.util.hash_pandas_object(pd.DataFrame(parts), index=False)]
+
+def _row_keys(df, row_key_columns, row_hashes):
+    if not row_key_columns:
+        # The output depends only on the input value, so rows are keyed by it: inserting or
+        # reordering rows does not invalidate the others
+        return row_hashes
+    return _typed_hashes(df[row_key_columns])
+
+def plan_incremental_run(df, input_column, transformation_id, dataset_id, fingerprint, row_key_columns=None):
+    """
+    Diffs the input column against the state saved by the previous run of this transformation
+    on this dataset. Rows are identified by row_key_columns (by their input value when
+    omitted) and compared by a hash of their input value.
+    Returns a plan dict whose 'changed_positions' are the only rows that need transforming.
+    """
+    missing_keys = [col for col in (row_key_columns or []) if col not in df.columns]
+    if missing_keys:
+        raise ValueError(f"Row key columns not found in data: {', '.join(missing_keys)}")
+
+    path = _state_path(transformation_id, dataset_id)
+    state = _load_state(path)
+    if not state or state.get('fingerprint') != fingerprint or state.get('input_column') != input_column:
+        state = {'rows': {}}
+    previous_rows = state['rows']
+
+    row_hashes = _typed_hashes(df[[input_column]])
+    row_keys = _row_keys(df, row_key_columns, row_hashes)
+
+    outputs = [None] * len(df)
+    changed_positions = []
+    inserted = modified = 0
+    for pos, (key, row_hash) in enumerate(zip(row_keys, row_hashes)):
+        previous = previous_rows.get(key)
+        if previous is not None and previous[0] == row_hash:
+            outputs[pos] = previous[1]
+            continue
+        changed_positions.append(pos)
+        if previous is None:
+            inserted += 1
+        else:
+            modified += 1
+
+    current_keys = set(row_keys)
+    return {
+        'state_path': path,
+        'fingerprint': fingerprint,
+        'input_column': input_column,
+        'row_keys': row_keys,
+        'row_hashes': row_hashes,
+        'outputs': outputs,
+        'changed_positions': changed_positions,
+        'stats': {
+            'total_rows': len(df),
+            'inserted': inserted,
+            'modified': modified,
+            'unchanged': len(df) - len(changed_positions),
+            'deleted': sum(1 for key in previous_rows if key not in current_keys)
+        }
+    }
+
+def complete_incremental_run(plan, changed_outputs):
+    """
+    Merges the outputs computed for plan['changed_positions'] with the reused ones, saves
+    the new state for the next run and returns the outputs for every row in order.
+    """
+    outputs = plan['outputs']
+    for pos, output in zip(plan['changed_positions'], changed_outputs):
+        outputs[pos] = output
+
+    state = {
+        'fingerprint': plan['fingerprint'],
+        'input_column': plan['input_column'],
+        'rows': {key: [row_hash, output] for key, row_hash, output in zip(plan['row_keys'], plan['row_hashes'], outputs)}
+    }
+    os.makedirs(INCREMENTAL_STATE_DIR, exist_ok=True)
+    # Write then rename so a concurrent run never reads a half-written state
+    tmp_path = f"{plan['state_path']}.{os.getpid()}.{id(plan)}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, default=_json_default)
+    os.replace(tmp_path, plan['state_path'])
+    evict_states()
+    return outputs
+
+def evict_states(now=None):
+    """
+    Deletes states unused for INCREMENTAL_STATE_TTL_S, then the least recently used ones
+    until the state directory fits in INCREMENTAL_STATE_MAX_BYTES. Returns the deleted paths.
+    """
+    now = now or time.time()
+    with _eviction_lock:
+        if not os.path.isdir(INCREMENTAL_STATE_DIR):
+            return []
+        states = []
+        for name in os.listdir(INCREMENTAL_STATE_DIR):
+            path = os.path.join(INCREMENTAL_STATE_DIR, name)
+            if name.endswith('.json'):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                states.append((stat.st_mtime, stat.st_size, path))
+        states.sort()
+        evicted = [path for last_used, _, path in states if now - last_used > INCREMENTAL_STATE_TTL_S]
+        remaining = [(size, path) for last_used, size, path in states if path not in evicted]
+        total_bytes = sum(size for size, _ in remaining)
+        while remaining and total_bytes > INCREMENTAL_STATE_MAX_BYTES:
+            size, path = remaining.pop(0)
+            total_bytes -= size
+            evicted.append(path)
+        for path in evicted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return evicted
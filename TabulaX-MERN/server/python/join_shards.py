@@ -0,0 +1,131 @@
+import os
+import gzip
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Coordinator mode for /fuzzy-join: the target table is split into contiguous shards, each
+# shard is matched by a worker (another flask_server.py instance) with return_match_indices,
+# and the per-shard best matches are merged here. Only the workers in TABULAX_JOIN_WORKERS are
+# ever contacted: all of them for targets of at least JOIN_SHARD_MIN_ROWS rows, or the subset
+# a request names in shard_workers.
+JOIN_WORKERS = [url.strip().rstrip('/') for url in os.environ.get("TABULAX_JOIN_WORKERS", "").split(',') if url.strip()]
+JOIN_SHARD_MIN_ROWS = int(os.environ.get("TABULAX_JOIN_SHARD_MIN_ROWS", "50000"))
+JOIN_SHARD_RETRIES = int(os.environ.get("TABULAX_JOIN_SHARD_RETRIES", "2"))
+JOIN_SHARD_TIMEOUT_S = float(os.environ.get("TABULAX_JOIN_SHARD_TIMEOUT_S", "600"))
+
+class ShardJoinError(Exception):
+    pass
+
+def join_shard_workers(data, target_rows):
+    """
+    The worker URLs to shard this join across, or [] to join locally. Raises ValueError
+    when shard_workers names a URL that is not a configured worker.
+    """
+    if data.get('return_match_indices'):
+        return [] # already a shard
+    workers = data.get('shard_workers')
+    if workers is None:
+        return JOIN_WORKERS if target_rows >= JOIN_SHARD_MIN_ROWS else []
+    if isinstance(workers, str):
+        workers = [workers]
+    if not isinstance(workers, list) or not all(isinstance(url, str) and url.strip() for url in workers):
+        raise ValueError("shard_workers must be a list of worker URLs.")
+    workers = [url.strip().rstrip('/') for url in workers]
+    unknown = [url for url in workers if url not in JOIN_WORKERS]
+    if unknown:
+        raise ValueError(f"shard_workers must be configured join workers (TABULAX_JOIN_WORKERS); not configured: {', '.join(unknown)}")
+    return workers
+
+def shard_bounds(total_rows, shard_count):
+    """
+    Contiguous [start, stop) row ranges splitting total_rows into at most shard_count shards.
+    """
+    edges = np.linspace(0, total_rows, min(shard_count, total_rows) + 1).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:])]
+
+def _records(df):
+    # Plain Python values so numbers survive the JSON round trip exactly
+    columns = {str(col): df[col].astype(object).where(df[col].notna(), None).tolist() for col in df.columns}
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+def match_indices_payload(best_indices, best_distances):
+    """
+    The JSON body of a worker's return_match_indices response.
+    """
+    return {
+        'success': True,
+        'best_indices': best_indices.tolist(),
+        'best_distances': [float(d) if np.isfinite(d) else None for d in best_distances]
+    }
+
+def _match_shard(worker, body, source_rows):
+    response = requests.post(
+        f"{worker}/fuzzy-join",
+        data=body,
+        headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip', 'Accept-Encoding': 'gzip'},
+        timeout=JOIN_SHARD_TIMEOUT_S
+    )
+    try:
+        result = response.json()
+    except ValueError:
+        raise ShardJoinError(f"{worker} answered {response.status_code} without a JSON body")
+    if response.status_code != 200 or not result.get('success'):
+        raise ShardJoinError(f"{worker} answered {response.status_code}: {result.get('message')}")
+    best_indices = np.asarray(result['best_indices'], dtype=np.int64)
+    best_distances = np.array([np.inf if d is None else d for d in result['best_distances']], dtype=np.float64)
+    if len(best_indices) != source_rows or len(best_distances) != source_rows:
+        raise ShardJoinError(f"{worker} returned {len(best_indices)} matches for {source_rows} source rows")
+    return best_indices, best_distances
+
+def sharded_match(source_df, target_df, transformed_source_col, target_col_to_join_on, transformation_class, max_distance_threshold, blocking_columns, blocking_keys, workers):
+    """
+    Same result as match_fuzzy_join, computed by workers over contiguous target shards.
+    Shard i starts on workers[i % len(workers)]; a failed shard is retried on the next
+    workers up to JOIN_SHARD_RETRIES times before ShardJoinError is raised. Merging keeps
+    the smallest distance and, on ties, the earliest shard, so ties still go to the
+    earliest target row.
+    """
+    source_columns = list(dict.fromkeys([transformed_source_col] + [src for src, _ in blocking_columns]))
+    target_columns = list(dict.fromkeys([target_col_to_join_on] + [tgt for _, tgt in blocking_columns]))
+    source_records = _records(source_df[source_columns])
+    target_part = target_df[target_columns]
+    bounds = shard_bounds(len(target_df), len(workers))
+
+    def run_shard(shard):
+        start, stop = bounds[shard]
+        body = gzip.compress(json.dumps({
+            'source_data': source_records,
+            'target_data': _records(target_part.iloc[start:stop]),
+            'transformed_source_col': transformed_source_col,
+            'target_col_to_join_on': target_col_to_join_on,
+            'transformation_class': transformation_class,
+            'max_distance_threshold': max_distance_threshold,
+            'blocking_columns': [list(pair) for pair in blocking_columns],
+            'blocking_keys': blocking_keys,
+            'return_match_indices': True
+        }, default=str).encode('utf-8'), compresslevel=1)
+        errors = []
+        for attempt in range(JOIN_SHARD_RETRIES + 1):
+            worker = workers[(shard + attempt) % len(workers)]
+            try:
+                return _match_shard(worker, body, len(source_df))
+            except (requests.RequestException, ShardJoinError) as e:
+                logger.warning(f"Join shard {shard} (target rows {start}-{stop}) failed on {worker}: {e}")
+                errors.append(str(e))
+        raise ShardJoinError(f"Join shard {shard} (target rows {start}-{stop}) failed after {len(errors)} attempts: {errors[-1]}")
+
+    with ThreadPoolExecutor(max_workers=max(1, len(bounds))) as executor:
+        results = list(executor.map(run_shard, range(len(bounds))))
+
+    best_indices = np.full(len(source_df), -1, dtype=np.int64)
+    best_distances = np.full(len(source_df), np.inf)
+    for (start, _), (shard_indices, shard_distances) in zip(bounds, results):
+        better = shard_distances < best_distances
+        best_indices[better] = shard_indices[better] + start
+        best_distances[better] = shard_distances[better]
+    return best_indices, best_distances
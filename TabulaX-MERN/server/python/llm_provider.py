@@ -0,0 +1,47 @@
+import os
+import re
+import time
+import json
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+# TABULAX_STUB_LLM=true swaps Gemini for a local deterministic stand-in (load tests, offline dev)
+STUB_LLM = os.environ.get("TABULAX_STUB_LLM", "false").lower() in ("1", "true", "yes")
+STUB_LLM_DELAY_MS = float(os.environ.get("TABULAX_STUB_LLM_DELAY_MS", "50"))
+STUB_LLM_TRANSFORMATION_TYPE = os.environ.get("TABULAX_STUB_LLM_TYPE", "String-based")
+
+class StubMessage:
+    def __init__(self, content):
+        self.content = content
+
+class StubLLM:
+    """
+    Answers the prompts used in this service with fixed, well-formed responses after a
+    configurable delay, so request handling can be exercised without an API key.
+    """
+    def __init__(self, delay_ms=STUB_LLM_DELAY_MS, transformation_type=STUB_LLM_TRANSFORMATION_TYPE):
+        self.delay_ms = delay_ms
+        self.transformation_type = transformation_type
+
+    def _respond(self, prompt):
+        if '"transformation_type"' in prompt:
+            return json.dumps({"transformation_type": self.transformation_type})
+        new_input = re.search(r'New input: "(.*)"', prompt)
+        if new_input:
+            return new_input.group(1).upper()
+        if 'def transform' in prompt or 'function' in prompt:
+            return "def transform(value):\n    if not value:\n        return \"\"\n    return str(value).upper()"
+        return "Text to Uppercase text"
+
+    def invoke(self, messages):
+        if self.delay_ms:
+            time.sleep(self.delay_ms / 1000.0)
+        prompt = "\n".join(getattr(message, 'content', str(message)) for message in messages)
+        return StubMessage(self._respond(prompt))
+
+def create_llm(model, **kwargs):
+    """
+    Returns the chat model used for transformations, or a StubLLM when TABULAX_STUB_LLM is set.
+    """
+    if STUB_LLM:
+        return StubLLM()
+    return ChatGoogleGenerativeAI(model=model, **kwargs)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""
+Concurrent load test for the TabulaX Flask service.
+
+Starts flask_server.py locally with the stub LLM (unless --url points at a running server),
+replays a weighted mix of /classify, /execute-transformation and /fuzzy-join requests from
+--concurrency threads, and reports throughput, p50/p95/p99 latency, error rates and the
+server's RSS over time.
+
+    python load_test.py --concurrency 16 --duration 60 --mix classify=1,execute=3,join=2
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+import numpy as np
+
+REQUEST_KINDS = {
+    'classify': '/classify',
+    'execute': '/execute-transformation',
+    'join': '/fuzzy-join'
+}
+
+FIRST_NAMES = ["Alice", "Bob", "Charlie", "David", "Eva", "Frank", "Grace", "Henry", "Isla", "Jack"]
+LAST_NAMES = ["Johnson", "Smith", "Brown", "Lee", "Green", "White", "Kim", "Adams", "Moore", "Black"]
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in REQUEST_KINDS:
+            raise ValueError(f"Unknown request kind '{kind}'. Use {', '.join(REQUEST_KINDS)}.")
+        weights[kind] = float(weight or 1)
+    return weights
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+def _typo(rng, value):
+    pos = rng.randrange(len(value))
+    return value[:pos] + value[pos + 1:]
+
+def build_payloads(rows, join_rows, seed):
+    """
+    Builds one payload per request kind; every request of a kind sends the same body.
+    """
+    rng = random.Random(seed)
+    names = [_name(rng) for _ in range(max(rows, join_rows))]
+    table = [{'id': i, 'name': names[i], 'city': rng.choice(["Paris", "Tokyo", "Lima"])} for i in range(rows)]
+    return {
+        'classify': {
+            'source_data': names[:10],
+            'target_data': [name.upper() for name in names[:10]]
+        },
+        'execute': {
+            'table_data': table,
+            'input_column_name': 'name',
+            'output_column_name': 'name_upper',
+            'transformation_type': 'String-based',
+            'transformation_code': "def transform(value):\n    if not value:\n        return ''\n    return str(value).upper()"
+        },
+        'join': {
+            'source_data': [{'id': i, 'name': names[i].upper()} for i in range(join_rows)],
+            'target_data': [{'ref': i, 'full_name': _typo(rng, names[i].upper())} for i in range(join_rows)],
+            'transformed_source_col': 'name',
+            'target_col_to_join_on': 'full_name',
+            'transformation_class': 'String-based',
+            'max_distance_threshold': 2
+        }
+    }
+
+def read_rss_mb(pid):
+    """
+    Resident set size of a process in MB, from /proc or psutil; None when neither is available.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / (1024.0 * 1024.0)
+    except Exception:
+        return None
+
+def start_server(port, stub_delay_ms):
+    env = dict(os.environ)
+    env.update({
+        'TABULAX_STUB_LLM': 'true',
+        'TABULAX_STUB_LLM_DELAY_MS': str(stub_delay_ms),
+        'GOOGLE_API_KEY': env.get('GOOGLE_API_KEY', 'stub')
+    })
+    # Run the app directly: flask_server's __main__ uses debug=True, whose reloader forks
+    # a child process that would hide the real RSS.
+    command = [sys.executable, '-c', f"import flask_server; flask_server.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_for_health(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    return False
+
+def send_request(base_url, kind, body, timeout):
+    request = urllib.request.Request(f"{base_url}{REQUEST_KINDS[kind]}", data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = json.loads(response.read())
+            ok = response.status == 200 and payload.get('success', True) and not payload.get('error')
+            status = response.status
+    except urllib.error.HTTPError as e:
+        ok, status = False, e.code
+    except (urllib.error.URLError, OSError, ValueError):
+        ok, status = False, None
+    return time.perf_counter() - start, ok, status
+
+def summarize(latencies, errors, elapsed):
+    if not latencies:
+        return {'requests': 0, 'errors': 0, 'error_rate': 0.0, 'throughput_rps': 0.0}
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000.0, [50, 95, 99])
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'error_rate': errors / len(latencies),
+        'throughput_rps': len(latencies) / elapsed,
+        'latency_ms': {'p50': round(p50, 1), 'p95': round(p95, 1), 'p99': round(p99, 1), 'max': round(max(latencies) * 1000.0, 1)}
+    }
+
+def run_load(base_url, weights, payloads, concurrency, duration, total_requests, timeout, server_pid, sample_interval, seed):
+    bodies = {kind: json.dumps(payload).encode('utf-8') for kind, payload in payloads.items()}
+    kinds = list(weights)
+    kind_weights = [weights[kind] for kind in kinds]
+    results = {kind: {'latencies': [], 'errors': 0, 'statuses': {}} for kind in kinds}
+    lock = threading.Lock()
+    issued = [0]
+    stop = threading.Event()
+    rss_samples = []
+    start = time.perf_counter()
+
+    def next_slot():
+        with lock:
+            if stop.is_set() or (total_requests and issued[0] >= total_requests):
+                return False
+            issued[0] += 1
+            return True
+
+    def worker(worker_id):
+        rng = random.Random(seed + worker_id)
+        while next_slot():
+            kind = rng.choices(kinds, kind_weights)[0]
+            latency, ok, status = send_request(base_url, kind, bodies[kind], timeout)
+            with lock:
+                results[kind]['latencies'].append(latency)
+                results[kind]['errors'] += 0 if ok else 1
+                results[kind]['statuses'][str(status)] = results[kind]['statuses'].get(str(status), 0) + 1
+
+    def sampler():
+        while not stop.is_set():
+            rss = read_rss_mb(server_pid) if server_pid else None
+            if rss is not None:
+                rss_samples.append({'t': round(time.perf_counter() - start, 2), 'rss_mb': round(rss, 1)})
+            stop.wait(sample_interval)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    sampler_thread = threading.Thread(target=sampler, daemon=True)
+    sampler_thread.start()
+    for thread in threads:
+        thread.start()
+    if duration:
+        for thread in threads:
+            thread.join(max(0.0, duration - (time.perf_counter() - start)))
+        stop.set()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    sampler_thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = [latency for result in results.values() for latency in result['latencies']]
+    report = {
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 2),
+        'overall': summarize(all_latencies, sum(result['errors'] for result in results.values()), elapsed),
+        'by_route': {
+            REQUEST_KINDS[kind]: dict(summarize(result['latencies'], result['errors'], elapsed), statuses=result['statuses'])
+            for kind, result in results.items()
+        },
+        'server_rss': {
+            'samples': rss_samples,
+            'peak_mb': max((sample['rss_mb'] for sample in rss_samples), default=None)
+        }
+    }
+    return report
+
+def print_report(report):
+    overall = report['overall']
+    print(f"\n{overall['requests']} requests in {report['elapsed_s']}s at concurrency {report['concurrency']}: "
+          f"{overall['throughput_rps']:.1f} req/s, error rate {overall['error_rate']:.2%}")
+    print(f"{'route':<26}{'reqs':>7}{'err%':>8}{'rps':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}")
+    for route, stats in report['by_route'].items():
+        latency = stats.get('latency_ms', {})
+        print(f"{route:<26}{stats['requests']:>7}{stats['error_rate']:>8.1%}{stats['throughput_rps']:>8.1f}"
+              f"{latency.get('p50', 0):>9}{latency.get('p95', 0):>9}{latency.get('p99', 0):>9}")
+    samples = report['server_rss']['samples']
+    if samples:
+        print(f"server RSS: start {samples[0]['rss_mb']} MB, end {samples[-1]['rss_mb']} MB, peak {report['server_rss']['peak_mb']} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the TabulaX Flask service")
+    parser.add_argument('--url', help="Base URL of a running server; by default a local server with the stub LLM is started")
+    parser.add_argument('--port', type=int, default=5051, help="Port for the locally started server")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds to run (ignored when --requests is set)")
+    parser.add_argument('--requests', type=int, default=0, help="Stop after this many requests")
+    parser.add_argument('--mix', default="classify=1,execute=3,join=2", help="Weighted mix of classify, execute and join")
+    parser.add_argument('--rows', type=int, default=1000, help="Rows in the /execute-transformation table")
+    parser.add_argument('--join-rows', type=int, default=300, help="Rows on each side of /fuzzy-join")
+    parser.add_argument('--stub-delay-ms', type=float, default=50.0, help="Latency of each stub LLM call")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--sample-interval', type=float, default=0.5, help="Seconds between RSS samples")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the full JSON report here")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url.rstrip('/') if args.url else f"http://127.0.0.1:{args.port}"
+    if not args.url:
+        server = start_server(args.port, args.stub_delay_ms)
+    try:
+        if not wait_for_health(base_url):
+            print(f"Server at {base_url} did not become healthy", file=sys.stderr)
+            return 1
+        report = run_load(
+            base_url, parse_mix(args.mix), build_payloads(args.rows, args.join_rows, args.seed),
+            args.concurrency, 0 if args.requests else args.duration, args.requests, args.timeout,
+            server.pid if server else None, args.sample_interval, args.seed
+        )
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import uuid
+import math
+import shutil
+import threading
+import numpy as np
+import pyarrow as pa
+from fuzzy_join import STRING_CLASSES, NUMERICAL_CLASSES, join_key_array, find_best_matches, assemble_joined_frame
+from frame_utils import arrow_safe_frame, encode_json_columns, table_to_frame
+
+# Registered reference tables: the table as an Arrow IPC file plus its join index as .npy
+# arrays, all opened memory-mapped so worker processes share the same pages
+REFERENCE_DIR = os.environ.get("TABULAX_REFERENCE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference_tables"))
+
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+class ReferenceNotFound(Exception):
+    pass
+
+def _reference_dir(reference_id):
+    if not reference_id or not all(c.isalnum() for c in reference_id):
+        raise ReferenceNotFound(f"Reference table '{reference_id}' not found.")
+    return os.path.join(REFERENCE_DIR, reference_id)
+
+def index_family(transformation_class):
+    if transformation_class in STRING_CLASSES:
+        return 'string'
+    if transformation_class in NUMERICAL_CLASSES:
+        return 'numeric'
+    raise ValueError(f"Unsupported transformation_class '{transformation_class}' for a reference table.")
+
+def _write_arrow(table, path):
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def _read_arrow(path):
+    # Zero-copy: column buffers point into the memory-mapped file
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+def register_reference_table(df, join_column, transformation_class):
+    """
+    Saves df as a reference table and builds its join index:
+    numeric - the distinct finite join keys, sorted, with the first row holding each key;
+    string - the rows with a join key, ordered by key length (then row).
+    Returns the metadata dict (reference_id, num_rows, columns, ...).
+    """
+    if join_column not in df.columns:
+        raise ValueError(f"Join column '{join_column}' not found in the reference data.")
+    family = index_family(transformation_class)
+    keys = join_key_array(df[join_column], transformation_class)
+
+    reference_id = uuid.uuid4().hex
+    directory = _reference_dir(reference_id)
+    staging = f"{directory}.tmp"
+    os.makedirs(staging)
+    try:
+        stored_df, json_columns = encode_json_columns(df)
+        _write_arrow(pa.Table.from_pandas(arrow_safe_frame(stored_df), preserve_index=False), os.path.join(staging, 'table.arrow'))
+        if family == 'numeric':
+            rows = np.flatnonzero(np.isfinite(keys))
+            order = rows[np.argsort(keys[rows], kind='stable')]
+            unique_keys, first = np.unique(keys[order], return_index=True)
+            np.save(os.path.join(staging, 'unique_keys.npy'), unique_keys)
+            np.save(os.path.join(staging, 'first_rows.npy'), order[first].astype(np.int64))
+        else:
+            lengths = np.array([-1 if key is None else len(key) for key in keys], dtype=np.int64)
+            rows = np.flatnonzero(lengths >= 0)
+            order = rows[np.argsort(lengths[rows], kind='stable')]
+            np.save(os.path.join(staging, 'length_order.npy'), order.astype(np.int64))
+            np.save(os.path.join(staging, 'sorted_lengths.npy'), lengths[order])
+            _write_arrow(pa.table({'key': pa.array(keys, type=pa.string())}), os.path.join(staging, 'keys.arrow'))
+
+        meta = {
+            'reference_id': reference_id,
+            'join_column': str(join_column),
+            'transformation_class': transformation_class,
+            'index': family,
+            'created_at': time.time(),
+            'num_rows': len(df),
+            'columns': [str(col) for col in df.columns],
+            'json_columns': json_columns,
+            'size_bytes': sum(os.path.getsize(os.path.join(staging, name)) for name in os.listdir(staging))
+        }
+        with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(staging, directory)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return meta
+
+def get_reference_meta(reference_id):
+    try:
+        with open(os.path.join(_reference_dir(reference_id), 'meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        raise ReferenceNotFound(f"Reference table '{reference_id}' not found.")
+
+def delete_reference_table(reference_id):
+    directory = _reference_dir(reference_id)
+    with _open_lock:
+        _open_indexes.pop(reference_id, None)
+    shutil.rmtree(directory, ignore_errors=True)
+
+class ReferenceIndex:
+    """
+    A registered reference table opened memory-mapped. match() finds the closest reference
+    row for each source value with the same results as find_best_matches over the whole
+    table, without scanning it.
+    """
+    def __init__(self, meta):
+        self.meta = meta
+        directory = _reference_dir(meta['reference_id'])
+        self.table = _read_arrow(os.path.join(directory, 'table.arrow'))
+        if meta['index'] == 'numeric':
+            self.unique_keys = np.load(os.path.join(directory, 'unique_keys.npy'), mmap_mode='r')
+            self.first_rows = np.load(os.path.join(directory, 'first_rows.npy'), mmap_mode='r')
+        else:
+            self.length_order = np.load(os.path.join(directory, 'length_order.npy'), mmap_mode='r')
+            self.sorted_lengths = np.load(os.path.join(directory, 'sorted_lengths.npy'), mmap_mode='r')
+            self.keys = _read_arrow(os.path.join(directory, 'keys.arrow')).column('key')
+
+    def target_frame(self, rows=None):
+        """
+        The reference rows at the given positions (all rows when None) as a DataFrame.
+        """
+        table = self.table if rows is None else self.table.take(pa.array(rows, type=pa.int64()))
+        return table_to_frame(table, self.meta.get('json_columns', []))
+
+    def match(self, source_values, max_distance_threshold):
+        """
+        Same contract as find_best_matches: (best_indices, best_distances) with reference row
+        positions, -1/np.inf when nothing is within max_distance_threshold, ties to the
+        earliest reference row.
+        """
+        if self.meta['index'] == 'numeric':
+            return self._match_numeric(np.asarray(source_values, dtype=np.float64), max_distance_threshold)
+        return self._match_string(np.asarray(source_values, dtype=object), max_distance_threshold)
+
+    def _match_numeric(self, source_nums, max_distance_threshold):
+        best_indices = np.full(len(source_nums), -1, dtype=np.int64)
+        best_distances = np.full(len(source_nums), np.inf)
+        unique_keys, first_rows = self.unique_keys, self.first_rows
+        rows = np.flatnonzero(np.isfinite(source_nums))
+        if not len(unique_keys) or not len(rows) or max_distance_threshold < 0:
+            return best_indices, best_distances
+
+        # The nearest key is one of the two neighbours of the insertion point
+        values = source_nums[rows]
+        right = np.searchsorted(unique_keys, values)
+        left = np.clip(right - 1, 0, len(unique_keys) - 1)
+        right = np.clip(right, 0, len(unique_keys) - 1)
+        left_distances = np.abs(values - unique_keys[left])
+        right_distances = np.abs(values - unique_keys[right])
+        distances = np.minimum(left_distances, right_distances)
+        # Equidistant keys on both sides: the earlier reference row wins
+        use_right = (right_distances < left_distances) | ((right_distances == left_distances) & (first_rows[right] < first_rows[left]))
+        nearest = np.where(use_right, first_rows[right], first_rows[left])
+
+        matched = np.isfinite(distances) & (distances <= max_distance_threshold)
+        best_indices[rows[matched]] = nearest[matched]
+        best_distances[rows[matched]] = distances[matched]
+        return best_indices, best_distances
+
+    def _match_string(self, source_values, max_distance_threshold):
+        best_indices = np.full(len(source_values), -1, dtype=np.int64)
+        best_distances = np.full(len(source_values), np.inf)
+        if not len(self.length_order) or max_distance_threshold < 0:
+            return best_indices, best_distances
+
+        # Levenshtein distance is at least the length difference, so a source value only
+        # needs the reference keys whose length is within the threshold of its own
+        source_lengths = np.array([-1 if value is None else len(value) for value in source_values], dtype=np.int64)
+        lengths = np.unique(source_lengths[source_lengths >= 0])
+        if not len(lengths):
+            return best_indices, best_distances
+        # No length difference exceeds the longest source or key, which also bounds an infinite threshold
+        reach = math.floor(min(max_distance_threshold, max(int(lengths[-1]), int(self.sorted_lengths[-1])) + 1))
+        # Keys in length order, converted once for the whole span the source lengths reach
+        first = np.searchsorted(self.sorted_lengths, lengths[0] - reach, side='left')
+        last = np.searchsorted(self.sorted_lengths, lengths[-1] + reach, side='right')
+        span_keys = np.array(self.keys.take(pa.array(self.length_order[first:last])).to_pylist(), dtype=object)
+        for length in lengths:
+            start = np.searchsorted(self.sorted_lengths, length - reach, side='left')
+            stop = np.searchsorted(self.sorted_lengths, length + reach, side='right')
+            if start == stop:
+                continue
+            row_order = np.argsort(self.length_order[start:stop], kind='stable') # ties go to the earliest row
+            candidates = np.asarray(self.length_order[start:stop])[row_order]
+            candidate_keys = span_keys[start - first:stop - first][row_order]
+            rows = np.flatnonzero(source_lengths == length)
+            indices, distances = find_best_matches(source_values[rows], candidate_keys, self.meta['transformation_class'], max_distance_threshold)
+            matched = indices >= 0
+            best_indices[rows[matched]] = candidates[indices[matched]]
+            best_distances[rows] = distances
+        return best_indices, best_distances
+
+def open_reference_index(reference_id):
+    """
+    The ReferenceIndex for reference_id, opened once per process and reused.
+    """
+    with _open_lock:
+        index = _open_indexes.get(reference_id)
+        if index is None:
+            index = ReferenceIndex(get_reference_meta(reference_id))
+            _open_indexes[reference_id] = index
+        return index
+
+def join_reference(index, source_df, transformed_source_col, max_distance_threshold):
+    """
+    perform_fuzzy_join against a registered reference table: only the matched reference
+    rows are read from the mapped table to build the output.
+    """
+    source_values = join_key_array(source_df[transformed_source_col], index.meta['transformation_class'])
+    best_indices, best_distances = index.match(source_values, max_distance_threshold)
+    matched_rows = np.unique(best_indices[best_indices >= 0])
+    target_df = index.target_frame(matched_rows)
+    local_indices = np.where(best_indices >= 0, np.searchsorted(matched_rows, best_indices), -1)
+    return assemble_joined_frame(source_df, target_df, index.meta['join_column'], local_indices, best_distances)
@@ -0,0 +1,154 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import cProfile
+import threading
+import tracemalloc
+import itertools
+from collections import Counter
+from functools import wraps
+from flask import request, make_response
+
+# Profiles are opt-in per request (X-TabulaX-Profile header or ?profile=) or sampled 1 in N
+PROFILE_DIR = os.environ.get("TABULAX_PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_SAMPLE_RATE = int(os.environ.get("TABULAX_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.environ.get("TABULAX_PROFILE_INTERVAL_MS", "5"))
+PROFILE_MODES = ["sample", "cprofile"]
+
+_request_counter = itertools.count(1)
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+class SamplingProfiler:
+    """
+    Samples the call stack of one thread at a fixed interval and aggregates the stacks in the
+    collapsed format ("outer;inner;leaf count") read by flamegraph.pl, speedscope and inferno.
+    """
+    def __init__(self, thread_id, interval_ms=PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def _start_tracemalloc():
+    # tracemalloc is process wide: the peak covers every request running meanwhile
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif _tracemalloc_users == 0:
+            tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    return peak
+
+def requested_profile_mode():
+    """
+    Profile mode for the current request, or None when it should not be profiled.
+    """
+    flag = request.headers.get('X-TabulaX-Profile') or request.args.get('profile')
+    if flag:
+        flag = flag.lower()
+        if flag in PROFILE_MODES:
+            return flag
+        return "sample" if flag in ("1", "true", "yes") else None
+    if PROFILE_SAMPLE_RATE > 0 and next(_request_counter) % PROFILE_SAMPLE_RATE == 0:
+        return "sample"
+    return None
+
+def _request_id():
+    # Only keep safe characters since the id becomes a file name
+    request_id = re.sub(r'[^A-Za-z0-9_.-]', '', request.headers.get('X-Request-ID', ''))[:64]
+    return request_id or uuid.uuid4().hex
+
+def profiled(view):
+    """
+    Route decorator that profiles opted-in requests and writes, under PROFILE_DIR:
+    <request_id>.folded (sample mode, collapsed stacks) or <request_id>.prof (cprofile mode,
+    pstats) plus <request_id>.json with timing and tracemalloc peak. The id is echoed in the
+    X-TabulaX-Profile-Id response header.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = requested_profile_mode()
+        if mode is None:
+            return view(*args, **kwargs)
+
+        request_id = _request_id()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_path = os.path.join(PROFILE_DIR, f"{request_id}.{'folded' if mode == 'sample' else 'prof'}")
+
+        _start_tracemalloc()
+        start = time.perf_counter()
+        if mode == "sample":
+            profiler = SamplingProfiler(threading.get_ident())
+            profiler.start()
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                profiler.stop()
+                duration = time.perf_counter() - start
+                peak_bytes = _stop_tracemalloc()
+            profiler.write_collapsed(profile_path)
+            samples = sum(profiler.stacks.values())
+        else:
+            profiler = cProfile.Profile()
+            try:
+                response = make_response(profiler.runcall(view, *args, **kwargs))
+            finally:
+                duration = time.perf_counter() - start
+                peak_bytes = _stop_tracemalloc()
+            profiler.dump_stats(profile_path)
+            samples = None
+
+        summary = {
+            'request_id': request_id,
+            'route': request.path,
+            'method': request.method,
+            'mode': mode,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000.0, 2),
+            'samples': samples,
+            'sample_interval_ms': PROFILE_INTERVAL_MS if mode == "sample" else None,
+            'tracemalloc_peak_bytes': peak_bytes,
+            'profile_file': os.path.basename(profile_path)
+        }
+        with open(os.path.join(PROFILE_DIR, f"{request_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        response.headers['X-TabulaX-Profile-Id'] = request_id
+        return response
+    return wrapper
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import uuid
+import base64
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from frame_utils import arrow_safe_frame, encode_json_columns, table_to_frame
+
+# Results are kept as Parquet files so pages and single columns can be read without
+# loading the whole table. Old results are evicted by age, then by total size.
+RESULT_STORE_DIR = os.environ.get("TABULAX_RESULT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "results"))
+RESULT_TTL_S = float(os.environ.get("TABULAX_RESULT_TTL_S", "3600"))
+RESULT_STORE_MAX_BYTES = float(os.environ.get("TABULAX_RESULT_MAX_BYTES", str(2 * 1024 ** 3)))
+RESULT_ROW_GROUP_SIZE = 10000
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+FILTER_OPS = ["eq", "ne", "contains"]
+
+_eviction_lock = threading.Lock()
+
+class ResultNotFound(Exception):
+    pass
+
+def _paths(result_id):
+    if not result_id or not all(c.isalnum() for c in result_id):
+        raise ResultNotFound(f"Result '{result_id}' not found.")
+    return os.path.join(RESULT_STORE_DIR, f"{result_id}.parquet"), os.path.join(RESULT_STORE_DIR, f"{result_id}.json")
+
+def save_result(df, kind, owner=None):
+    """
+    Writes df to the store and returns its metadata dict (result_id, num_rows, columns, ...).
+    owner, when given, is kept in the metadata for callers that scope results per user.
+    """
+    os.makedirs(RESULT_STORE_DIR, exist_ok=True)
+    result_id = uuid.uuid4().hex
+    parquet_path, meta_path = _paths(result_id)
+    df, json_columns = encode_json_columns(df)
+    df = arrow_safe_frame(df)
+    df.to_parquet(parquet_path, index=False, row_group_size=RESULT_ROW_GROUP_SIZE)
+    meta = {
+        'result_id': result_id,
+        'kind': kind,
+        'owner': owner,
+        'created_at': time.time(),
+        'num_rows': len(df),
+        'columns': list(df.columns),
+        'json_columns': json_columns,
+        'size_bytes': os.path.getsize(parquet_path)
+    }
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    evict_results()
+    return meta
+
+def get_result_meta(result_id):
+    _, meta_path = _paths(result_id)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        raise ResultNotFound(f"Result '{result_id}' not found.")
+
+def delete_result(result_id):
+    for path in _paths(result_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def evict_results(now=None):
+    """
+    Deletes results older than RESULT_TTL_S, then the oldest ones until the store fits in
+    RESULT_STORE_MAX_BYTES. Returns the evicted result ids.
+    """
+    now = now or time.time()
+    with _eviction_lock:
+        if not os.path.isdir(RESULT_STORE_DIR):
+            return []
+        metas = []
+        for name in os.listdir(RESULT_STORE_DIR):
+            if name.endswith('.json'):
+                try:
+                    metas.append(get_result_meta(name[:-len('.json')]))
+                except ResultNotFound:
+                    continue
+        metas.sort(key=lambda meta: meta['created_at'])
+        evicted = [meta['result_id'] for meta in metas if now - meta['created_at'] > RESULT_TTL_S]
+        remaining = [meta for meta in metas if meta['result_id'] not in evicted]
+        total_bytes = sum(meta['size_bytes'] for meta in remaining)
+        while remaining and total_bytes > RESULT_STORE_MAX_BYTES:
+            oldest = remaining.pop(0)
+            total_bytes -= oldest['size_bytes']
+            evicted.append(oldest['result_id'])
+        for result_id in evicted:
+            delete_result(result_id)
+        return evicted
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))['offset'])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if offset < 0:
+        raise ValueError("Invalid cursor.")
+    return offset
+
+def _filter_mask(column, op, value, json_encoded=False):
+    if json_encoded:
+        # Compare the stored values' string form, not their JSON text
+        strings = pa.array([None if val is None else str(json.loads(val)) for val in column.to_pylist()], type=pa.string())
+    else:
+        strings = column.cast(pa.string())
+    if op == 'eq':
+        mask = pc.equal(strings, value)
+    elif op == 'ne':
+        mask = pc.not_equal(strings, value)
+    else:
+        mask = pc.match_substring(strings, value)
+    return pc.fill_null(mask, False)
+
+def read_result_page(result_id, cursor=None, limit=DEFAULT_PAGE_SIZE, columns=None, filter_column=None, filter_value=None, filter_op='eq'):
+    """
+    Reads one page of a stored result. Only the requested columns are read, and only from the
+    row groups covering the page; a filter is evaluated row group by row group on the filter
+    column alone. Filters compare the column's string form.
+    Returns {'data': DataFrame, 'next_cursor': str or None, 'total_rows': matching rows}.
+    """
+    meta = get_result_meta(result_id)
+    parquet_path, _ = _paths(result_id)
+    offset = decode_cursor(cursor)
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    columns = columns or meta['columns']
+    json_columns = meta.get('json_columns', [])
+    unknown = [col for col in columns + ([filter_column] if filter_column else []) if col not in meta['columns']]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    if filter_op not in FILTER_OPS:
+        raise ValueError(f"Unknown filter_op '{filter_op}'. Supported: {', '.join(FILTER_OPS)}")
+
+    parquet_file = pq.ParquetFile(parquet_path, memory_map=True)
+    if filter_column:
+        total_rows, tables = 0, []
+        for i in range(parquet_file.num_row_groups):
+            filter_values = parquet_file.read_row_group(i, columns=[filter_column]).column(0)
+            mask = _filter_mask(filter_values, filter_op, str(filter_value), filter_column in json_columns)
+            matching = pc.indices_nonzero(mask).to_numpy()
+            # This group's matches that fall inside [offset, offset + limit) overall
+            start = max(offset - total_rows, 0)
+            stop = min(offset + limit - total_rows, len(matching))
+            if start < stop:
+                tables.append(parquet_file.read_row_group(i, columns=columns).take(pa.array(matching[start:stop], type=pa.int64())))
+            total_rows += len(matching)
+        page = pa.concat_tables(tables) if tables else None
+    else:
+        total_rows = meta['num_rows']
+        row_group_start, tables = 0, []
+        for i in range(parquet_file.num_row_groups):
+            group_rows = parquet_file.metadata.row_group(i).num_rows
+            group_stop = row_group_start + group_rows
+            if group_stop > offset and row_group_start < offset + limit:
+                tables.append((row_group_start, parquet_file.read_row_group(i, columns=columns)))
+            row_group_start = group_stop
+        page = None
+        if tables:
+            first_start = tables[0][0]
+            page = pa.concat_tables([table for _, table in tables]).slice(offset - first_start, limit)
+
+    data = table_to_frame(page, json_columns) if page is not None else pd.DataFrame(columns=columns)
+    next_offset = offset + len(data)
+    return {
+        'data': data,
+        'next_cursor': encode_cursor(next_offset) if next_offset < total_rows else None,
+        'total_rows': total_rows
+    }
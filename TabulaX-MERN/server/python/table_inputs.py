@@ -0,0 +1,124 @@
+import os
+import json
+import math
+import pandas as pd
+import pyarrow.parquet as pq
+from frame_utils import records_to_frame, compact_series
+
+# Tables can be passed as a reference to a file in the upload directory shared with the Node
+# server (a path relative to it, or an upload id: the file name without extension) instead
+# of inline JSON records. Paths outside the directory are rejected. CSV and JSON Lines
+# values are read as strings, the way the client's Papa.parse hands inline tables over.
+UPLOAD_DIR = os.environ.get("TABULAX_UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads"))
+CSV_CHUNK_ROWS = int(os.environ.get("TABULAX_CSV_CHUNK_ROWS", "100000"))
+TABLE_FILE_FORMATS = {'.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.parquet': 'parquet'}
+ESTIMATED_BYTES_PER_ROW = 64
+
+class TableInputError(ValueError):
+    pass
+
+def resolve_table_file(reference):
+    """
+    Absolute path of the table file a reference points to. Raises TableInputError when it
+    does not name a supported file inside UPLOAD_DIR.
+    """
+    if not isinstance(reference, str) or not reference.strip():
+        raise TableInputError("Table file reference must be a non-empty string.")
+    upload_dir = os.path.realpath(UPLOAD_DIR)
+    path = os.path.realpath(os.path.join(upload_dir, reference))
+    if os.path.commonpath([upload_dir, path]) != upload_dir:
+        raise TableInputError(f"Table file '{reference}' is outside the upload directory.")
+
+    if not os.path.splitext(path)[1]:
+        # Upload id: the one supported file with that name
+        matches = [path + ext for ext in TABLE_FILE_FORMATS if os.path.isfile(path + ext)]
+        if len(matches) > 1:
+            raise TableInputError(f"Upload id '{reference}' matches several files; pass the file name.")
+        path = matches[0] if matches else path
+    if not os.path.isfile(path):
+        raise TableInputError(f"Table file '{reference}' not found.")
+    if os.path.splitext(path)[1].lower() not in TABLE_FILE_FORMATS:
+        raise TableInputError(f"Unsupported table file '{reference}'. Supported: {', '.join(TABLE_FILE_FORMATS)}")
+    return path
+
+def _compact(df, plain_columns):
+    for col in df.columns:
+        if col not in plain_columns:
+            df[col] = compact_series(df[col])
+    return df
+
+def _is_missing(val):
+    return val is None or (isinstance(val, float) and math.isnan(val))
+
+def _as_text(chunk):
+    # JSON values as text: strings unchanged, anything else as written in JSON, nulls kept
+    for col in chunk.columns:
+        chunk[col] = pd.Series([val if isinstance(val, str) or _is_missing(val) else json.dumps(val, default=str)
+                                for val in chunk[col].tolist()], index=chunk.index, dtype=object)
+    return chunk
+
+def _read_chunked(reader, plain_columns, convert=None):
+    # Each chunk is converted to compact storage before the next is parsed, so raw chunks
+    # are not all held at once; categoricals are decided once the whole column is known
+    chunks = []
+    with reader:
+        for chunk in reader:
+            if convert is not None:
+                chunk = convert(chunk)
+            for col in chunk.columns:
+                if col not in plain_columns:
+                    chunk[col] = compact_series(chunk[col], allow_categorical=False)
+            chunks.append(chunk)
+    if not chunks:
+        return pd.DataFrame()
+    return _compact(pd.concat(chunks, ignore_index=True), plain_columns)
+
+def read_table_file(reference, plain_columns=()):
+    """
+    Reads a referenced CSV, JSON (array of row objects, or JSON Lines) or Parquet file into
+    a DataFrame with the same compact column storage as records_to_frame.
+    """
+    path = resolve_table_file(reference)
+    file_format = TABLE_FILE_FORMATS[os.path.splitext(path)[1].lower()]
+    try:
+        if file_format == 'parquet':
+            return _compact(pq.read_table(path, memory_map=True).to_pandas(), plain_columns)
+        if file_format == 'csv':
+            return _read_chunked(pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=CSV_CHUNK_ROWS), plain_columns)
+        if file_format == 'jsonl':
+            reader = pd.read_json(path, lines=True, dtype=False, convert_dates=False, chunksize=CSV_CHUNK_ROWS)
+            return _read_chunked(reader, plain_columns, convert=_as_text)
+        with open(path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+    except (OSError, ValueError) as e:
+        raise TableInputError(f"Could not read table file '{reference}': {e}")
+    if not isinstance(records, list) or not all(isinstance(row, dict) for row in records):
+        raise TableInputError(f"Table file '{reference}' must contain a JSON array of row objects.")
+    return records_to_frame(records, plain_columns)
+
+def table_file_bytes(reference):
+    """
+    Data size of a referenced file for admission control: the uncompressed column data for
+    Parquet, the size on disk otherwise. 0 when the reference is invalid.
+    """
+    try:
+        path = resolve_table_file(reference)
+        if path.lower().endswith('.parquet'):
+            metadata = pq.ParquetFile(path).metadata
+            return sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+        return os.path.getsize(path)
+    except (TableInputError, OSError, ValueError):
+        return 0
+
+def estimate_table_file_rows(reference):
+    """
+    Row count of a referenced file for admission control: exact for Parquet, estimated from
+    the file size otherwise. 0 when the reference is invalid.
+    """
+    try:
+        path = resolve_table_file(reference)
+        if path.lower().endswith('.parquet'):
+            return pq.ParquetFile(path).metadata.num_rows
+        return os.path.getsize(path) // ESTIMATED_BYTES_PER_ROW
+    except (TableInputError, OSError, ValueError):
+        return 0
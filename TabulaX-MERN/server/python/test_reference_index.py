@@ -0,0 +1,44 @@
+import random
+import pytest
+import reference_index
+from fuzzy_join import perform_fuzzy_join
+from frame_utils import records_to_frame
+
+@pytest.fixture(autouse=True)
+def reference_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(reference_index, 'REFERENCE_DIR', str(tmp_path))
+    monkeypatch.setattr(reference_index, '_open_indexes', {})
+
+def _records(df):
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+def _assert_same_join(source, target, transformation_class, threshold):
+    source_df, target_df = records_to_frame(source), records_to_frame(target)
+    meta = reference_index.register_reference_table(target_df, 'key', transformation_class)
+    index = reference_index.open_reference_index(meta['reference_id'])
+    indexed = reference_index.join_reference(index, source_df, 'value', threshold)
+    scanned = perform_fuzzy_join(source_df, target_df, 'value', 'key', transformation_class, threshold)
+    assert _records(indexed) == _records(scanned)
+
+def _words(rng, count, max_length):
+    return [''.join(rng.choice('abc') for _ in range(rng.randint(0, max_length))) for _ in range(count)]
+
+def test_source_longer_than_every_key():
+    source = [{'value': 'USA!!!!'}, {'value': 'FRANCE'}, {'value': None}]
+    target = [{'key': 'US', 'name': 'United States'}, {'key': 'FR', 'name': 'France'}]
+    _assert_same_join(source, target, 'String-based', 6)
+
+@pytest.mark.parametrize("threshold", [0, 1, 2.5, 6, float('inf')])
+@pytest.mark.parametrize("seed", range(3))
+def test_string_index_matches_full_scan(seed, threshold):
+    rng = random.Random(seed)
+    source = [{'value': value} for value in _words(rng, 80, 12)]
+    target = [{'key': key, 'row': i, 'mixed': [1, 'a', None, [2]][i % 4]} for i, key in enumerate(_words(rng, 60, 5))]
+    _assert_same_join(source, target, 'String-based', threshold)
+
+@pytest.mark.parametrize("threshold", [0, 1, 2.5, float('inf')])
+def test_numeric_index_matches_full_scan(threshold):
+    rng = random.Random(threshold)
+    source = [{'value': rng.choice([rng.randint(0, 40), 2.5, None])} for _ in range(80)]
+    target = [{'key': rng.choice([rng.randint(0, 40), None]), 'row': i} for i in range(60)]
+    _assert_same_join(source, target, 'Numerical', threshold)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+import result_store
+from frame_utils import records_to_frame
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, 'RESULT_STORE_DIR', str(tmp_path))
+
+def _records(df):
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+def test_mixed_columns_round_trip():
+    records = [{'id': i, 'name': f'n{i}', 'mixed': [1, 'a', 2.5, True, [1, 2], {'k': 'v'}, None][i % 7]} for i in range(50)]
+    df = records_to_frame(records)
+    meta = result_store.save_result(df, 'test')
+    assert meta['json_columns'] == ['mixed']
+
+    page = result_store.read_result_page(meta['result_id'], limit=1000)
+    assert _records(page['data']) == _records(df)
+
+def test_mixed_columns_page_and_filter():
+    df = pd.DataFrame({'id': np.arange(30), 'mixed': pd.Series([1, 'a', 2.5] * 10, dtype=object)})
+    meta = result_store.save_result(df, 'test')
+
+    page = result_store.read_result_page(meta['result_id'], cursor=result_store.encode_cursor(3), limit=3)
+    assert page['data']['mixed'].tolist() == [1, 'a', 2.5]
+
+    filtered = result_store.read_result_page(meta['result_id'], limit=100, filter_column='mixed', filter_value='1')
+    assert filtered['total_rows'] == 10
+    assert filtered['data']['mixed'].tolist() == [1] * 10
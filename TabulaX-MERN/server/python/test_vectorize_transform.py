@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+from vectorize_transform import apply_transform, compile_transform
+
+ROWS = 300
+
+def _scalar(code):
+    namespace = {}
+    exec(code, namespace)
+    func = next(value for key, value in namespace.items() if callable(value) and not key.startswith('__'))
+    def safe(value):
+        try:
+            return func(value)
+        except Exception as e:
+            return f"error: {type(e).__name__}"
+    return safe
+
+def _series(special):
+    values = [f"x{i} Smith" if i % 2 else f"John {i}" for i in range(ROWS)]
+    for position, value in special.items():
+        values[position] = value
+    return pd.Series(values)
+
+CASES = [
+    "def f(value):\n    if value[0] == 'x':\n        return 'X'\n    return 'other'\n",
+    "def f(value):\n    if value[0] != 'x' and value[1] == '1':\n        return 'A'\n    return 'B'\n",
+    "def f(value):\n    if value == '' or value[0] == 'x':\n        return 'empty or x'\n    return value\n",
+    "def f(value):\n    if not value.split()[1] == 'Smith':\n        return value.upper()\n    return value.lower()\n",
+    "def f(value):\n    return 'X' if value[0] == 'x' else 'other'\n",
+    "def f(value):\n    first = value.split(' ')[0]\n    if 'x' in first[-1]:\n        return first\n    return first + '!'\n",
+    "def f(value):\n    if value:\n        return value[0]\n    return 'empty'\n",
+]
+
+@pytest.mark.parametrize("code", CASES)
+@pytest.mark.parametrize("special", [{}, {150: ''}, {0: '', 150: '', 299: ''}, {150: 'x'}, {150: None}])
+def test_matches_scalar_apply(code, special):
+    assert compile_transform(code) is not None
+    series = _series(special)
+    func = _scalar(code)
+    assert apply_transform(series, func, code).tolist() == series.apply(func).tolist()
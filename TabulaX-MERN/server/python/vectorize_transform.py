@@ -0,0 +1,507 @@
+import os
+import ast
+import logging
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+logger = logging.getLogger(__name__)
+
+# Generated `def transform(value)` code that only uses simple string operations is compiled
+# into Arrow compute kernels over the whole column instead of one Python call per row
+VECTORIZE_TRANSFORMS = os.environ.get("TABULAX_VECTORIZE_TRANSFORMS", "true").lower() in ("1", "true", "yes")
+VECTORIZE_MIN_ROWS = int(os.environ.get("TABULAX_VECTORIZE_MIN_ROWS", "64"))
+# Rows run through both the plan and the scalar function before the plan is trusted
+SELF_CHECK_ROWS = int(os.environ.get("TABULAX_VECTORIZE_CHECK_ROWS", "32"))
+
+# The ASCII kernels match Python's str methods on ASCII text only; other rows always take the
+# scalar path. Python also treats \x1c-\x1f as whitespace, unlike the whitespace kernels.
+PYTHON_ONLY_WHITESPACE = r'[\x1c-\x1f]'
+
+CASE_METHODS = {"upper": pc.ascii_upper, "lower": pc.ascii_lower, "title": pc.ascii_title,
+                "capitalize": pc.ascii_capitalize, "swapcase": pc.ascii_swapcase, "casefold": pc.ascii_lower}
+STRIP_METHODS = {"strip": (pc.ascii_trim_whitespace, pc.utf8_trim),
+                 "lstrip": (pc.ascii_ltrim_whitespace, pc.utf8_ltrim),
+                 "rstrip": (pc.ascii_rtrim_whitespace, pc.utf8_rtrim)}
+PAD_METHODS = {"ljust": pc.utf8_rpad, "rjust": pc.utf8_lpad}
+PREDICATE_METHODS = {"isdigit": pc.ascii_is_decimal, "isdecimal": pc.ascii_is_decimal, "isnumeric": pc.ascii_is_decimal,
+                     "isalpha": pc.ascii_is_alpha, "isalnum": pc.ascii_is_alnum, "isspace": pc.ascii_is_space,
+                     "isupper": pc.ascii_is_upper, "islower": pc.ascii_is_lower, "istitle": pc.ascii_is_title}
+AFFIX_METHODS = {"startswith": pc.starts_with, "endswith": pc.ends_with}
+
+# Environment key of the input array
+INPUT_KEY = '__input__'
+
+_type_of = np.frompyfunc(type, 1, 1)
+
+class Unsupported(Exception):
+    pass
+
+def _const(node, *types):
+    if isinstance(node, ast.Constant) and type(node.value) in types:
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and int in types:
+        return -_const(node.operand, int)
+    raise Unsupported(f"expected a {'/'.join(t.__name__ for t in types)} literal")
+
+def _mask(array):
+    return pc.fill_null(array, False).to_numpy(zero_copy_only=False)
+
+def _invalid(array):
+    # Null operands are rows where the scalar function would have raised
+    return ~_mask(pc.is_valid(array))
+
+def _with_nulls(array, null_mask):
+    # Nulls mark rows the plan cannot produce; the scalar function handles them
+    if not null_mask.any():
+        return array
+    return pc.if_else(pa.array(null_mask), pa.scalar(None, array.type), array)
+
+def _string_get(strings, position):
+    stop = position + 1 if position != -1 else None
+    picked = pc.utf8_slice_codeunits(strings, position, stop) if stop is not None else pc.utf8_slice_codeunits(strings, position)
+    lengths = pc.fill_null(pc.utf8_length(strings), 0).to_numpy(zero_copy_only=False)
+    return _with_nulls(picked, ~((-lengths <= position) & (position < lengths)))
+
+def _list_parts(lists):
+    lengths = pc.fill_null(pc.list_value_length(lists), 0).to_numpy(zero_copy_only=False).astype(np.int64)
+    starts = lists.offsets.to_numpy()[:-1].astype(np.int64)
+    return lengths, starts, lists.values
+
+def _list_get(lists, position):
+    lengths, starts, values = _list_parts(lists)
+    valid = (-lengths <= position) & (position < lengths) & _mask(pc.is_valid(lists))
+    indices = np.where(valid, starts + np.where(position < 0, lengths + position, position), 0)
+    picked = values.take(pa.array(indices)) if len(values) else pa.nulls(len(lists), values.type)
+    return _with_nulls(picked, ~valid)
+
+def _list_slice(lists, start, stop, step):
+    # Python slice bounds per row, as slice.indices(length) would compute them
+    lengths, starts, values = _list_parts(lists)
+    step = step or 1
+    if step > 0:
+        lower, upper = np.zeros_like(lengths), lengths
+        begin = lower if start is None else np.clip(np.where(start < 0, lengths + start, start), lower, upper)
+        end = upper if stop is None else np.clip(np.where(stop < 0, lengths + stop, stop), lower, upper)
+        counts = np.maximum(0, (end - begin + step - 1) // step)
+    else:
+        lower, upper = np.full_like(lengths, -1), lengths - 1
+        begin = upper if start is None else np.clip(np.where(start < 0, lengths + start, start), lower, upper)
+        end = lower if stop is None else np.clip(np.where(stop < 0, lengths + stop, stop), lower, upper)
+        counts = np.maximum(0, (begin - end - step - 1) // -step)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    within = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+    indices = np.repeat(starts + begin, counts) + within * step
+    sliced = pa.ListArray.from_arrays(pa.array(offsets, pa.int32()), values.take(pa.array(indices, pa.int64())))
+    return _with_nulls(sliced, ~_mask(pc.is_valid(lists)))
+
+def _concat(*parts):
+    # Nulls propagate, so a row fails if any part failed
+    return pc.binary_join_element_wise(*parts, '')
+
+class _Compiler:
+    """
+    Compiles the body of a one-argument function into steps over Arrow arrays. Expressions
+    compile to (kind, fn) with kind 'str', 'list', 'bool' or 'const'; fn maps the environment
+    of arrays to an array (or, for 'const', is the literal itself).
+    """
+    def __init__(self, arg_name):
+        self.kinds = {arg_name: 'str'}
+        self.constants = {}
+        self.whitespace_sensitive = False
+
+    def literal(self, node, *types):
+        # Names bound to literals earlier in the function count as literals too
+        if isinstance(node, ast.Name) and self.kinds.get(node.id) == 'const' and type(self.constants[node.id]) in types:
+            return self.constants[node.id]
+        return _const(node, *types)
+
+    def statements(self, body):
+        steps = []
+        for i, stmt in enumerate(body):
+            if isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant) and isinstance(stmt.value.value, str):
+                continue # docstring
+            if isinstance(stmt, ast.Pass):
+                continue
+            if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.targets[0], ast.Name):
+                name = stmt.targets[0].id
+                kind, fn = self.expr(stmt.value)
+                self.kinds[name] = kind
+                if kind == 'const':
+                    self.constants[name] = fn # folded at compile time
+                else:
+                    steps.append(('assign', name, fn))
+            elif isinstance(stmt, ast.If):
+                if len(stmt.body) != 1 or not isinstance(stmt.body[0], ast.Return) or stmt.body[0].value is None:
+                    raise Unsupported("if blocks may only return")
+                steps.append(('guard', self.condition(stmt.test), self.value(stmt.body[0].value)))
+                # `if c: return x` followed by the else block is the same as the else block inline
+                return steps + self.statements(stmt.orelse + body[i + 1:])
+            elif isinstance(stmt, ast.Return) and stmt.value is not None:
+                steps.append(('return', self.value(stmt.value)))
+                return steps
+            else:
+                raise Unsupported(f"unsupported statement {type(stmt).__name__}")
+        raise Unsupported("function can end without returning")
+
+    def value(self, node):
+        kind, fn = self.expr(node)
+        if kind == 'const' and isinstance(fn, str):
+            return lambda env, value=fn: pa.scalar(value)
+        if kind != 'str':
+            raise Unsupported("only string results are vectorized")
+        return fn
+
+    def string(self, node):
+        kind, fn = self.expr(node)
+        if kind != 'str':
+            raise Unsupported("expected a string expression")
+        return fn
+
+    def condition(self, node):
+        """
+        Compiles a test to fn(env) -> (mask, invalid): the rows where it holds, and the rows
+        where an operand is null (the scalar function would raise there, so they must fail).
+        """
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            inner = self.condition(node.operand)
+            def negated(env):
+                mask, invalid = inner(env)
+                return ~mask, invalid
+            return negated
+        if isinstance(node, ast.BoolOp):
+            parts = [self.condition(value) for value in node.values]
+            conjunction = isinstance(node.op, ast.And)
+            def combined(env):
+                size = len(env[INPUT_KEY])
+                result, invalid = np.full(size, conjunction), np.zeros(size, dtype=bool)
+                pending = np.ones(size, dtype=bool) # rows not yet decided by short-circuiting
+                for part in parts:
+                    mask, part_invalid = part(env)
+                    invalid |= pending & part_invalid
+                    if conjunction:
+                        result &= mask
+                        pending &= mask
+                    else:
+                        result |= mask
+                        pending &= ~mask
+                return result, invalid
+            return combined
+        if isinstance(node, ast.Compare) and len(node.ops) == 1:
+            op, left, right = node.ops[0], node.left, node.comparators[0]
+            if isinstance(op, (ast.Is, ast.IsNot)) and isinstance(right, ast.Constant) and right.value is None:
+                fn = self.string(left) # a string is never None
+                def is_none(env, result=isinstance(op, ast.IsNot)):
+                    operand = fn(env)
+                    return np.full(len(operand), result), _invalid(operand)
+                return is_none
+            if isinstance(op, (ast.Eq, ast.NotEq)):
+                operand, literal = (right, left) if isinstance(left, ast.Constant) else (left, right)
+                fn, literal = self.string(operand), self.literal(literal, str)
+                compare = pc.equal if isinstance(op, ast.Eq) else pc.not_equal
+                def compared(env):
+                    values = fn(env)
+                    return _mask(compare(values, literal)), _invalid(values)
+                return compared
+            if isinstance(op, (ast.In, ast.NotIn)):
+                needle, fn = self.literal(left, str), self.string(right)
+                negate = isinstance(op, ast.NotIn)
+                def contained(env):
+                    values = fn(env)
+                    mask = _mask(pc.match_substring(values, needle))
+                    return (~mask if negate else mask), _invalid(values)
+                return contained
+            raise Unsupported("unsupported comparison")
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'isinstance'
+                and len(node.args) == 2 and isinstance(node.args[1], ast.Name) and node.args[1].id == 'str'):
+            fn = self.string(node.args[0])
+            def is_string(env):
+                values = fn(env)
+                return np.ones(len(values), dtype=bool), _invalid(values)
+            return is_string
+        kind, fn = self.expr(node)
+        if kind == 'bool':
+            def truth(env):
+                values = fn(env)
+                return _mask(values), _invalid(values)
+            return truth
+        if kind == 'str':
+            # Truthiness of a string: non-empty
+            def non_empty(env):
+                values = fn(env)
+                return _mask(pc.not_equal(values, '')), _invalid(values)
+            return non_empty
+        raise Unsupported("unsupported condition")
+
+    def expr(self, node):
+        if isinstance(node, ast.Constant):
+            if type(node.value) not in (str, int):
+                raise Unsupported("unsupported literal")
+            return 'const', node.value
+        if isinstance(node, ast.Name):
+            if node.id not in self.kinds:
+                raise Unsupported(f"unknown name {node.id}")
+            kind, name = self.kinds[node.id], node.id
+            if kind == 'const':
+                return kind, self.constants[name]
+            return kind, lambda env: env[name]
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+            left_kind, left = self.expr(node.left)
+            right_kind, right = self.expr(node.right)
+            if left_kind == right_kind == 'const' and isinstance(left, str) and isinstance(right, str):
+                return 'const', left + right
+            left, right = self.value(node.left), self.value(node.right)
+            return 'str', lambda env: _concat(left(env), right(env))
+        if isinstance(node, ast.JoinedStr):
+            parts = []
+            for value in node.values:
+                if isinstance(value, ast.Constant):
+                    parts.append(lambda env, text=value.value: pa.scalar(text))
+                elif isinstance(value, ast.FormattedValue) and value.conversion == -1 and value.format_spec is None:
+                    parts.append(self.string(value.value))
+                else:
+                    raise Unsupported("unsupported f-string field")
+            if not parts:
+                return 'const', ''
+            return 'str', lambda env: _concat(*[part(env) for part in parts])
+        if isinstance(node, ast.IfExp):
+            test = self.condition(node.test)
+            body, orelse = self.value(node.body), self.value(node.orelse)
+            def choose(env):
+                mask, invalid = test(env)
+                return _with_nulls(pc.if_else(pa.array(mask), body(env), orelse(env)), invalid)
+            return 'str', choose
+        if isinstance(node, ast.Subscript):
+            kind, fn = self.expr(node.value)
+            if kind not in ('str', 'list'):
+                raise Unsupported("only strings and split results can be indexed")
+            if isinstance(node.slice, ast.Slice):
+                start, stop, step = [None if part is None else self.literal(part, int) for part in (node.slice.lower, node.slice.upper, node.slice.step)]
+                if step == 0:
+                    raise Unsupported("slice step cannot be zero")
+                if kind == 'list':
+                    return 'list', lambda env: _list_slice(fn(env), start, stop, step)
+                kwargs = {'start': start if start is not None else (0 if (step or 1) > 0 else -1), 'step': step or 1}
+                if stop is not None:
+                    kwargs['stop'] = stop
+                return 'str', lambda env: pc.utf8_slice_codeunits(fn(env), **kwargs)
+            position = self.literal(node.slice, int)
+            # Out-of-range positions give nulls, and those rows fall back to the scalar function
+            if kind == 'list':
+                return 'str', lambda env: _list_get(fn(env), position)
+            return 'str', lambda env: _string_get(fn(env), position)
+        if isinstance(node, ast.Call):
+            return self.call(node)
+        raise Unsupported(f"unsupported expression {type(node).__name__}")
+
+    def call(self, node):
+        if node.keywords:
+            raise Unsupported("keyword arguments are not vectorized")
+        if isinstance(node.func, ast.Name) and node.func.id == 'str' and len(node.args) == 1:
+            return 'str', self.string(node.args[0]) # str() of a string is the string itself
+        if not isinstance(node.func, ast.Attribute):
+            raise Unsupported("unsupported call")
+        method, args = node.func.attr, node.args
+
+        if method == 'join' and len(args) == 1:
+            separator = self.literal(node.func.value, str)
+            if isinstance(args[0], (ast.List, ast.Tuple)) and args[0].elts:
+                items = [self.value(item) for item in args[0].elts]
+                return 'str', lambda env: pc.binary_join_element_wise(*[item(env) for item in items], separator)
+            kind, fn = self.expr(args[0])
+            if kind != 'list':
+                raise Unsupported("join needs a list")
+            return 'str', lambda env: pc.binary_join(fn(env), separator)
+
+        receiver = self.string(node.func.value)
+        if method in CASE_METHODS and not args:
+            return 'str', lambda env: CASE_METHODS[method](receiver(env))
+        if method in PREDICATE_METHODS and not args:
+            self.whitespace_sensitive |= method == 'isspace'
+            return 'bool', lambda env: PREDICATE_METHODS[method](receiver(env))
+        if method in STRIP_METHODS and len(args) <= 1:
+            whitespace, characters = STRIP_METHODS[method]
+            if args:
+                chars = self.literal(args[0], str)
+                return 'str', lambda env: characters(receiver(env), chars)
+            self.whitespace_sensitive = True
+            return 'str', lambda env: whitespace(receiver(env))
+        if method in AFFIX_METHODS and len(args) == 1:
+            affix = self.literal(args[0], str)
+            return 'bool', lambda env: AFFIX_METHODS[method](receiver(env), affix)
+        if method in PAD_METHODS and 1 <= len(args) <= 2:
+            width = self.literal(args[0], int)
+            fillchar = self.literal(args[1], str) if len(args) == 2 else ' '
+            if len(fillchar) != 1:
+                raise Unsupported("fill character must be one character")
+            return 'str', lambda env: PAD_METHODS[method](receiver(env), width, fillchar)
+        if method == 'replace' and len(args) in (2, 3):
+            old, new = self.literal(args[0], str), self.literal(args[1], str)
+            count = self.literal(args[2], int) if len(args) == 3 else -1
+            if not old or count == 0 or count < -1:
+                raise Unsupported("unsupported replace arguments")
+            return 'str', lambda env: pc.replace_substring(receiver(env), old, new, max_replacements=None if count == -1 else count)
+        if method in ('split', 'rsplit') and len(args) <= 2:
+            separator = None
+            if args and not (isinstance(args[0], ast.Constant) and args[0].value is None):
+                separator = self.literal(args[0], str)
+                if not separator:
+                    raise Unsupported("empty separator")
+            maxsplit = self.literal(args[1], int) if len(args) == 2 else -1
+            if maxsplit == 0 or maxsplit < -1:
+                raise Unsupported("unsupported maxsplit")
+            options = {'max_splits': None if maxsplit == -1 else maxsplit, 'reverse': method == 'rsplit'}
+            if separator is not None:
+                return 'list', lambda env: pc.split_pattern(receiver(env), separator, **options)
+            if maxsplit != -1:
+                raise Unsupported("whitespace split with maxsplit") # Python's trailing whitespace rules differ
+            self.whitespace_sensitive = True
+            def split_whitespace(env):
+                # Python drops leading and trailing whitespace before splitting
+                strings = pc.ascii_trim_whitespace(receiver(env))
+                # Arrow splits a blank string into [''] where Python gives []
+                blank = _mask(pc.equal(strings, ''))
+                return _with_nulls(pc.ascii_split_whitespace(strings, **options), blank)
+            return 'list', split_whitespace
+        raise Unsupported(f"unsupported method {method}")
+
+class VectorizedTransform:
+    """
+    A compiled transform. run() evaluates it over an Arrow string array and returns the
+    output array plus a mask of rows it could not produce (null inputs included); the scalar
+    function handles those rows.
+    """
+    def __init__(self, arg_name, steps, whitespace_sensitive):
+        self.arg_name = arg_name
+        self.steps = steps
+        self.whitespace_sensitive = whitespace_sensitive
+
+    def run(self, strings):
+        env = {INPUT_KEY: strings, self.arg_name: strings}
+        result = pa.nulls(len(strings), strings.type)
+        returned = np.zeros(len(strings), dtype=bool)
+        failed = ~_mask(pc.is_valid(strings))
+
+        def settle(mask, value):
+            nonlocal result
+            result = pc.if_else(pa.array(mask), value, result)
+            if not isinstance(value, pa.Scalar):
+                failed[mask & ~_mask(pc.is_valid(value))] = True
+            returned[mask] = True
+
+        for step in self.steps:
+            if step[0] == 'assign':
+                _, name, fn = step
+                env[name] = fn(env)
+                if isinstance(env[name], pa.Array):
+                    # A scalar call would have raised here (e.g. an index out of range)
+                    failed |= ~_mask(pc.is_valid(env[name])) & ~returned
+            elif step[0] == 'guard':
+                _, condition, fn = step
+                mask, invalid = condition(env)
+                failed |= invalid & ~returned
+                settle(mask & ~returned & ~failed, fn(env))
+            else:
+                settle(~returned & ~failed, step[1](env))
+        return result, failed
+
+@lru_cache(maxsize=256)
+def compile_transform(code):
+    """
+    Compiles code defining a single one-argument transform function into a
+    VectorizedTransform, or returns None when it uses anything outside the supported subset
+    (string literals, concatenation, f-strings, slicing, indexing, split/join, case, strip
+    and padding methods, replace, and `if ...: return ...` guards).
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError, TypeError):
+        return None
+    if len(tree.body) != 1 or not isinstance(tree.body[0], ast.FunctionDef):
+        return None
+    func = tree.body[0]
+    arguments = func.args
+    if (func.decorator_list or len(arguments.args) != 1 or arguments.defaults or arguments.vararg
+            or arguments.kwarg or arguments.kwonlyargs or arguments.posonlyargs):
+        return None
+    arg_name = arguments.args[0].arg
+    compiler = _Compiler(arg_name)
+    try:
+        steps = compiler.statements(func.body)
+    except Unsupported as e:
+        logger.info(f"Transform not vectorized: {e}")
+        return None
+    return VectorizedTransform(arg_name, steps, compiler.whitespace_sensitive)
+
+def _input_strings(series):
+    """
+    The series as an Arrow string array, null wherever the value is not a str.
+    """
+    if isinstance(series.dtype, pd.StringDtype) and series.dtype.storage == 'pyarrow':
+        return pa.array(series.array).cast(pa.string())
+    values = series.to_numpy(dtype=object)
+    try:
+        return pa.array(values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        is_str = _type_of(values) == str
+        return pa.array(np.where(is_str, values, None), type=pa.string())
+
+def _run_plan(plan, strings):
+    try:
+        return plan.run(strings)
+    except (pa.ArrowException, ValueError, TypeError, IndexError) as e:
+        logger.warning(f"Vectorized transform failed ({e}); using the scalar path.")
+        return None
+
+def _self_check(plan, strings, transform_func):
+    valid = np.flatnonzero(_mask(pc.is_valid(strings)))
+    if not len(valid):
+        return False
+    positions = valid[np.unique(np.linspace(0, len(valid) - 1, min(SELF_CHECK_ROWS, len(valid))).astype(np.int64))]
+    sample = strings.take(pa.array(positions))
+    run = _run_plan(plan, sample)
+    if run is None:
+        return False
+    planned, failed = run
+    for value, planned_value, row_failed in zip(sample.to_pylist(), planned.to_pylist(), failed):
+        if row_failed:
+            continue
+        expected = transform_func(value)
+        if type(expected) is not type(planned_value) or expected != planned_value:
+            logger.warning(f"Vectorized transform disagrees with the scalar function on {value!r}; using the scalar path.")
+            return False
+    return True
+
+def apply_transform(series, transform_func, code):
+    """
+    Same values as series.apply(transform_func). When code compiles to a vectorized plan that
+    agrees with transform_func on a sample, ASCII string rows are transformed by the plan;
+    other rows, and rows the plan cannot produce, go through transform_func. A fully
+    vectorized result is returned as Arrow-backed strings.
+    """
+    plan = compile_transform(code) if VECTORIZE_TRANSFORMS and code and len(series) >= VECTORIZE_MIN_ROWS else None
+    if plan is None:
+        return series.apply(transform_func)
+
+    strings = _input_strings(series)
+    vectorizable = pc.string_is_ascii(strings)
+    if plan.whitespace_sensitive:
+        vectorizable = pc.and_(vectorizable, pc.invert(pc.match_substring_regex(strings, PYTHON_ONLY_WHITESPACE)))
+    strings = _with_nulls(strings, ~_mask(vectorizable))
+
+    run = _run_plan(plan, strings) if _self_check(plan, strings, transform_func) else None
+    if run is None:
+        return series.apply(transform_func)
+    planned, failed = run
+    scalar_positions = np.flatnonzero(failed)
+    logger.info(f"Vectorized transform: {len(series) - len(scalar_positions)} rows vectorized, {len(scalar_positions)} via the scalar function")
+    if not len(scalar_positions):
+        return pd.Series(pd.arrays.ArrowStringArray(planned), index=series.index, name=series.name)
+
+    outputs = planned.to_numpy(zero_copy_only=False).astype(object)
+    # Called value by value: applying to the subset could infer another dtype (ints as floats)
+    for position, value in zip(scalar_positions, series.iloc[scalar_positions].to_numpy(dtype=object)):
+        outputs[position] = transform_func(value)
+    return pd.Series(outputs, index=series.index, name=series.name)
@@ -9,6 +9,11 @@ const {
   getTransformation,
   deleteTransformation,
   executeTransformation,
+  executeTransformationsBatch,
+  transformAndJoin,
+  getResultPage,
+  deleteResult,
+  uploadTableFile,
   downloadJoinedData
 } = require('../controllers/transformationController');
 const { protect } = require('../middleware/authMiddleware');
@@ -32,6 +37,20 @@ router.get('/download/:filename', protect, downloadJoinedData);
 // New route for executing a specific transformation function
 router.post('/execute', protect, executeTransformation);
 
+// Run several saved transformations over one table in a single pass
+router.post('/execute-batch', protect, executeTransformationsBatch);
+
+// Apply a saved transformation and fuzzy join the result without returning the transformed table
+router.post('/transform-and-join', protect, transformAndJoin);
+
+// Upload a table once and pass its uploadId as tableFile, sourceFile or targetFile
+router.post('/uploads', protect, upload.single('file'), uploadTableFile);
+
+// Page through or delete results kept on the Flask side (storeResult)
+router.route('/results/:resultId')
+  .get(protect, getResultPage)
+  .delete(protect, deleteResult);
+
 // CRUD operations for saved transformations
 router.route('/')
   .post(protect, saveTransformation)